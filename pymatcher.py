@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """
-Match 2 columns in spreadsheet files and merge row in output file.
+Match 2 columns in spreadsheet or CSV files and merge row in output file.
+
+Spreadsheet libraries are imported only to read or write files of their
+format. Use match_rows to match rows of Python iterables.
 """
 
 __author__ = "Sylvain Dangin"
@@ -10,15 +13,114 @@ __maintainer__ = "Sylvain Dangin"
 __email__ = "sylvain.dangin@gmail.com"
 __status__ = "Development"
 
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import fnmatch
+import glob
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import mmap
+import operator
 import os
+import pickle
+import queue
 import sys
-import openpyxl
-import xlrd
-import xlwt
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
 
 class Matcher():
+    # Number of rows written in xls file before flushing them
+    XLS_FLUSH_ROWS = 1000
+    # Maximum number of rows in a sheet of a xls file
+    XLS_MAX_ROWS = 65536
+    # Maximum size in bytes of the ranges of the first input matched by each worker
+    RANGE_SIZE = 4 * 1024 * 1024
+    # Number of rows produced at once while the statistics are counted
+    STATS_CHUNK_ROWS = 1024
+    # Number of records stored together in a sort spill file
+    SPILL_CHUNK_SIZE = 1000
+    # Number of threads which read the parts of an input
+    READ_THREADS = 4
+    # Number of chunks of rows read in advance for each part of an input
+    READ_QUEUE_CHUNKS = 16
+    # Version of the format of the cache files
+    CACHE_VERSION = 1
+    # Version of the format of the state files of the delta mode
+    STATE_VERSION = 3
+    # First bytes of the index files
+    INDEX_MAGIC = b'PYMATCHER-INDEX-1\n'
+    # First bytes of the spreadsheet files
+    XLSX_MAGIC = b'PK\x03\x04'
+    XLS_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    # Quoting of the CSV files
+    CSV_QUOTING = {
+        'minimal': csv.QUOTE_MINIMAL,
+        'all': csv.QUOTE_ALL,
+        'nonnumeric': csv.QUOTE_NONNUMERIC,
+        'none': csv.QUOTE_NONE
+    }
+    # Normalizations of the match keys
+    NORMALIZATIONS = ['case', 'space', 'accents', 'numbers']
+    # Match engines
+    MATCH_ENGINES = ['hash', 'nested', 'sort-merge']
+    # Options applied by match_rows, the other ones need files
+    ROWS_OPTIONS = ['ignore_header', 'match_engine', 'memory_budget', 'normalizations', 'fuzzy_threshold',
+                    'duplicates_1', 'duplicates_2', 'join_mode']
+    # Pre-filters of the streamed input
+    PREFILTERS = ['bloom', 'set']
+    # Rate of false positives of the bloom filters
+    BLOOM_ERROR_RATE = 0.01
+    # Modes of split of the output in shards
+    SHARD_MODES = ['sheets', 'files']
+    # Join modes, which rows are written
+    JOIN_MODES = ['inner', 'left', 'right', 'full', 'anti']
+    # Policies for the rows with the same key in an input, with cap:K
+    DUPLICATES_POLICIES = ['all', 'first', 'last', 'concat', 'aggregate', 'error']
+
     output_sheetname = ''
     ignore_header = False
+    match_engine = 'hash'
+    memory_budget = 64
+    workers = 1
+    cache_dir = None
+    cache_size = 1024
+    clear_cache_first = False
+    out_dir = None
+    match_index = None
+    columns_1 = None
+    columns_2 = None
+    sheets_1 = None
+    sheets_2 = None
+    csv_delimiter = None
+    csv_encoding = 'utf-8'
+    csv_quoting = 'minimal'
+    normalizations = []
+    fuzzy_threshold = None
+    prefilter = None
+    rows_per_shard = None
+    shard_mode = 'sheets'
+    duplicates_1 = 'all'
+    duplicates_2 = 'all'
+    join_mode = 'inner'
+    extra_inputs = []
+    state_filename = None
+    server_socket = None
+    server_port = None
+    show_stats = False
+    stats_filename = None
+    progress_interval = 10
+    listeners = []
+    stats = None
     match_column_1 = -1
     match_column_2 = -1
     input_data_1 = []
@@ -34,6 +136,38 @@ class Matcher():
         """
         self.output_sheetname = 'match'
         self.ignore_header = False
+        self.match_engine = 'hash'
+        self.memory_budget = 64
+        self.workers = 1
+        self.cache_dir = None
+        self.cache_size = 1024
+        self.clear_cache_first = False
+        self.out_dir = None
+        self.match_index = None
+        self.columns_1 = None
+        self.columns_2 = None
+        self.sheets_1 = None
+        self.sheets_2 = None
+        self.csv_delimiter = None
+        self.csv_encoding = 'utf-8'
+        self.csv_quoting = 'minimal'
+        self.normalizations = []
+        self.fuzzy_threshold = None
+        self.prefilter = None
+        self.rows_per_shard = None
+        self.shard_mode = 'sheets'
+        self.duplicates_1 = 'all'
+        self.duplicates_2 = 'all'
+        self.join_mode = 'inner'
+        self.extra_inputs = []
+        self.state_filename = None
+        self.server_socket = None
+        self.server_port = None
+        self.show_stats = False
+        self.stats_filename = None
+        self.progress_interval = 10
+        self.listeners = []
+        self.stats = None
         self.match_column_1 = -1
         self.match_column_2 = -1
         self.input_data_1 = []
@@ -47,33 +181,88 @@ class Matcher():
         :return: Array with the data of the file.
         :rtype: Array
         """
-        return_data = []
-
         if not os.path.exists(input_filename):
             raise Exception('Error: Input file not found.')
 
-        workbook = xlrd.open_workbook(filename = input_filename)
-        worksheet = workbook.sheet_by_index(0)
-        
-        for row_index, row_data in enumerate(range(worksheet.nrows)):
-            row = []
-            for column_index, column_data in enumerate(range(worksheet.ncols)):
-                row.append(worksheet.cell_value(row_index, column_index))
-            return_data.append(row)
-        return return_data
-        
-    def write_output_data_to_xls(self, output_filename, output_data, output_sheetname = 'match'):
+        return list(self.iter_input_data_from_xls(input_filename))
+
+    def iter_input_data_from_xls(self, input_filename, columns = None, file_contents = None, sheet_index = 0):
+        """Read input data in old Excel file (xls) row by row
+
+        Only the read sheet is loaded, and the file is memory-mapped instead
+        of being copied in memory.
+
+        :param input_filename: Path of the input file
+        :param columns: Columns to read, see project_rows. All by default.
+        :param file_contents: Content of the file, as bytes or mmap. Read
+                              from the file by default.
+        :param sheet_index: Index of the sheet, the first one by default
+
+        :return: Generator of the rows of the file.
+        :rtype: Generator
+        """
+        input_file = None
+        if file_contents is None:
+            if not os.path.exists(input_filename):
+                raise Exception('Error: Input file not found.')
+            input_file = open(input_filename, 'rb')
+            if os.fstat(input_file.fileno()).st_size > 0:
+                file_contents = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                file_contents = b''
+
+        try:
+            import xlrd
+            workbook = xlrd.open_workbook(filename = input_filename, file_contents = file_contents, on_demand = True)
+            try:
+                worksheet = workbook.sheet_by_index(sheet_index)
+                if worksheet.nrows == 0:
+                    return
+                if columns is None:
+                    for row_index in range(worksheet.nrows):
+                        yield worksheet.row_values(row_index)
+                else:
+                    # Read only the selected columns, column by column
+                    indexes = self.get_column_indexes(worksheet.row_values(0), columns)
+                    column_values = [worksheet.col_values(column_index) if column_index < worksheet.ncols
+                                     else [None] * worksheet.nrows for column_index in indexes]
+                    yield from zip(*column_values)
+            finally:
+                workbook.release_resources()
+        finally:
+            if input_file is not None:
+                if isinstance(file_contents, mmap.mmap):
+                    file_contents.close()
+                input_file.close()
+
+    def write_output_data_to_xls(self, output_filename, output_data, output_sheetname = 'match', rows_per_sheet = None, other_sheets = ()):
         """Write output data in old Excel file (xls)
 
+        Written rows are flushed regularly in their binary form to limit the
+        memory used by the cells.
+
         :param output_filename: Path of the output file
-        :param output_data: Data to write.
+        :param output_data: Data to write, array or iterable of rows.
+        :param output_sheetname: Name of the first sheet
+        :param rows_per_sheet: Maximum number of rows in a sheet, without the header
+        :param other_sheets: Array of tuples (name, rows) written after the first sheet
         """
+        import xlwt
         workbook = xlwt.Workbook()
-        worksheet = workbook.add_sheet(output_sheetname)
 
-        for row_index, row in enumerate(output_data):
-            for col_index, col in enumerate(row):
-                worksheet.write(row_index, col_index, col)
+        for sheetname, sheet_data in [(output_sheetname, output_data)] + list(other_sheets):
+            worksheet = workbook.add_sheet(sheetname)
+            current_sheet_number = 0
+            for sheet_number, row_index, row in self.iter_sheet_rows(sheet_data, rows_per_sheet):
+                if sheet_number != current_sheet_number:
+                    worksheet.flush_row_data()
+                    worksheet = workbook.add_sheet(sheetname + '_' + str(sheet_number + 1))
+                    current_sheet_number = sheet_number
+                for col_index, col in enumerate(row):
+                    worksheet.write(row_index, col_index, col)
+                if row_index % self.XLS_FLUSH_ROWS == self.XLS_FLUSH_ROWS - 1:
+                    worksheet.flush_row_data()
+            worksheet.flush_row_data()
         workbook.save(output_filename)
 
     def read_input_data_from_xlsx(self, input_filename):
@@ -84,35 +273,151 @@ class Matcher():
         :return: Array with the data of the file.
         :rtype: Array
         """
-        return_data = []
+        if not os.path.exists(input_filename):
+            raise Exception('Error: Input file not found.')
+
+        return list(self.iter_input_data_from_xlsx(input_filename))
+
+    def iter_input_data_from_xlsx(self, input_filename, columns = None, sheet_index = 0):
+        """Read input data in new Excel file (xlsx) row by row
+
+        The workbook is opened in read-only mode, so the rows are parsed
+        only when they are consumed.
 
+        :param input_filename: Path of the input file
+        :param columns: Columns to read, see project_rows. All by default.
+        :param sheet_index: Index of the sheet, the first one by default
+
+        :return: Generator of the rows of the file.
+        :rtype: Generator
+        """
         if not os.path.exists(input_filename):
             raise Exception('Error: Input file not found.')
 
-        workbook = openpyxl.load_workbook(input_filename)
-        worksheet = workbook.worksheets[0]
+        import openpyxl
+        # Open the file as a file object, openpyxl checks the extension of filenames
+        with open(input_filename, 'rb') as input_file:
+            workbook = openpyxl.load_workbook(input_file, read_only=True)
+            try:
+                worksheet = workbook.worksheets[sheet_index]
+                if columns is None:
+                    for row_data in worksheet.iter_rows(values_only=True):
+                        yield list(row_data)
+                else:
+                    yield from self.project_rows(worksheet.iter_rows(values_only=True), columns)
+            finally:
+                workbook.close()
 
-        for row_index, row_data in enumerate(worksheet.rows):
-            row = []
-            for col_data in row_data:
-                row.append(col_data.value)
-            return_data.append(row)
-        return return_data
-    
-    def write_output_data_to_xlsx(self, output_filename, output_data, output_sheetname = 'match'):
+    def write_output_data_to_xlsx(self, output_filename, output_data, output_sheetname = 'match', rows_per_sheet = None, other_sheets = ()):
         """Write output data in new Excel file (xlsx)
 
+        The workbook is created in write-only mode, so each row is written
+        as soon as it is produced.
+
         :param output_filename: Path of the output file
-        :param output_data: Data to write.
-       """
-        workbook = openpyxl.Workbook()
-        worksheet = workbook.active
-        worksheet.title = output_sheetname
-
-        for row in output_data:
-            worksheet.append(row)
+        :param output_data: Data to write, array or iterable of rows.
+        :param output_sheetname: Name of the first sheet
+        :param rows_per_sheet: Maximum number of rows in a sheet, without the header
+        :param other_sheets: Array of tuples (name, rows) written after the first sheet
+        """
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+
+        for sheetname, sheet_data in [(output_sheetname, output_data)] + list(other_sheets):
+            worksheet = workbook.create_sheet(sheetname)
+            current_sheet_number = 0
+            for sheet_number, row_index, row in self.iter_sheet_rows(sheet_data, rows_per_sheet):
+                if sheet_number != current_sheet_number:
+                    worksheet = workbook.create_sheet(sheetname + '_' + str(sheet_number + 1))
+                    current_sheet_number = sheet_number
+                worksheet.append(row)
         workbook.save(output_filename)
 
+    def iter_sheet_rows(self, output_data, rows_per_sheet = None):
+        """Split output rows in sheets, the header is repeated in each sheet
+
+        :param output_data: Data to write, array or iterable of rows.
+        :param rows_per_sheet: Maximum number of rows in a sheet, without
+                               the header. No limit by default.
+
+        :return: Generator of tuples (number of the sheet, index of the row in the sheet, row), start at 0
+        :rtype: Generator
+        """
+        rows = iter(output_data)
+        header = None
+        if rows_per_sheet is not None and not self.ignore_header:
+            header = next(rows, None)
+            if header is None:
+                return
+            yield 0, 0, header
+        sheet_number = 0
+        sheet_rows = 0
+        first_row_index = 0 if header is None else 1
+        for row in rows:
+            if sheet_rows == rows_per_sheet:
+                sheet_number += 1
+                sheet_rows = 0
+                if header is not None:
+                    yield sheet_number, 0, header
+            yield sheet_number, first_row_index + sheet_rows, row
+            sheet_rows += 1
+
+    def iter_input_data_from_csv(self, input_filename, columns = None, delimiter = None):
+        """Read input data in CSV or TSV file row by row
+
+        :param input_filename: Path of the input file
+        :param columns: Columns to read, see project_rows. All by default.
+        :param delimiter: Delimiter of the columns. Delimiter option, or
+                          tabulation if the first line contains one, or comma
+                          by default.
+
+        :return: Generator of the rows of the file.
+        :rtype: Generator
+        """
+        if not os.path.exists(input_filename):
+            raise Exception('Error: Input file not found.')
+
+        # Remove the byte order mark written by some spreadsheet softwares
+        encoding = 'utf-8-sig' if self.csv_encoding.lower() in ['utf-8', 'utf8'] else self.csv_encoding
+        with open(input_filename, 'r', newline='', encoding=encoding) as input_file:
+            if delimiter is None:
+                delimiter = self.csv_delimiter
+            if delimiter is None:
+                delimiter = '\t' if '\t' in input_file.readline() else ','
+                input_file.seek(0)
+            rows = csv.reader(input_file, delimiter=delimiter, quoting=self.CSV_QUOTING[self.csv_quoting])
+            if columns is None:
+                yield from rows
+            else:
+                yield from self.project_rows(rows, columns)
+
+    def write_output_data_to_csv(self, output_filename, output_data, delimiter = ','):
+        """Write output data in CSV or TSV file
+
+        :param output_filename: Path of the output file
+        :param output_data: Data to write, array or iterable of rows.
+        :param delimiter: Delimiter of the columns
+        """
+        with open(output_filename, 'w', newline='', encoding=self.csv_encoding) as output_file:
+            writer = csv.writer(output_file, delimiter=delimiter, quoting=self.CSV_QUOTING[self.csv_quoting])
+            writer.writerows(output_data)
+
+    def detect_input_format(self, input_filename):
+        """Detect the format of an input file from its first bytes
+
+        :param input_filename: Path of the input file
+
+        :return: xlsx, xls or csv
+        :rtype: String
+        """
+        with open(input_filename, 'rb') as input_file:
+            magic = input_file.read(len(self.XLS_MAGIC))
+        if magic.startswith(self.XLSX_MAGIC):
+            return 'xlsx'
+        elif magic == self.XLS_MAGIC:
+            return 'xls'
+        return 'csv'
+
     def read_argv(self, argv):
         """Read command line arguments and extract params
         """
@@ -120,119 +425,3108 @@ class Matcher():
             self.set_default_values()
 
             try:
-                for arg in argv:
-                    if '--' == arg[:2]:
-                        if 'no-header' == arg[2:]:
-                            self.ignore_header = True
-                        elif 'output-sheetname' in arg:
-                            self.output_sheetname = arg.split('=')[1]
-                # Match column argument
-                column = argv[len(argv) - 4]
-                if column.isdigit():
-                    self.match_column_1 = int(column)
-                column = argv[len(argv) - 2]
-                if column.isdigit():
-                    self.match_column_2 = int(column)
-                if self.match_column_1 < 1 or self.match_column_2 < 1:
+                result, err = self.read_options(argv)
+                if not result:
+                    return result, err
+                # Match column argument, inputs after the second one are extra inputs
+                arguments = [arg for arg in argv[1:] if '--' != arg[:2]]
+                if len(arguments) < 5 or len(arguments) % 2 == 0:
+                    return False, 'Not enough arguments'
+                self.match_column_1 = self.read_match_column(arguments[1])
+                self.match_column_2 = self.read_match_column(arguments[3])
+                if self.match_column_1 == -1 or self.match_column_2 == -1:
                     return False, 'Bad column'
+                for input_index in range(4, len(arguments) - 1, 2):
+                    match_column = self.read_match_column(arguments[input_index + 1])
+                    if match_column == -1:
+                        return False, 'Bad column'
+                    self.extra_inputs.append((arguments[input_index], match_column))
+                match_columns_count = len(self.get_match_columns(1))
+                if len(self.get_match_columns(2)) != match_columns_count or \
+                        any(len(self.get_match_columns(input_number)) != match_columns_count
+                            for input_number in range(3, len(self.extra_inputs) + 3)):
+                    return False, 'Bad number of columns'
 
                 return True, ''
             except Exception as e:
                 return False, 'Error in arguments'
         return False, 'Not enough arguments'
 
+    def read_index_argv(self, argv):
+        """Read command line arguments of the index command
+
+        exec [options] index input_file match_column index_file
+        """
+        self.set_default_values()
+        try:
+            result, err = self.read_options(argv)
+            if not result:
+                return result, err
+            arguments = [arg for arg in argv[2:] if '--' != arg[:2]]
+            if len(arguments) != 3:
+                return False, 'Not enough arguments'
+            self.match_column_2 = self.read_match_column(arguments[1])
+            if self.match_column_2 == -1:
+                return False, 'Bad column'
+            return True, ''
+        except Exception as e:
+            return False, 'Error in arguments'
+
+    def read_batch_argv(self, argv):
+        """Read command line arguments of the batch command
+
+        exec [options] batch index_file match_column input_file [input_file ...]
+        """
+        self.set_default_values()
+        try:
+            result, err = self.read_options(argv)
+            if not result:
+                return result, err
+            arguments = [arg for arg in argv[2:] if '--' != arg[:2]]
+            if len(arguments) < 3:
+                return False, 'Not enough arguments'
+            self.match_column_1 = self.read_match_column(arguments[1])
+            if self.match_column_1 == -1:
+                return False, 'Bad column'
+            if self.out_dir is None:
+                return False, 'Output directory missing'
+            return True, ''
+        except Exception as e:
+            return False, 'Error in arguments'
+
+    def read_serve_argv(self, argv):
+        """Read command line arguments of the serve command
+
+        exec [options] serve input_file match_column [input_file match_column ...]
+
+        :return: Result, error and the tables as tuples (input file, match column)
+        :rtype: Tuple
+        """
+        self.set_default_values()
+        try:
+            result, err = self.read_options(argv)
+            if not result:
+                return result, err, []
+            arguments = [arg for arg in argv[2:] if '--' != arg[:2]]
+            if len(arguments) < 2 or len(arguments) % 2 != 0:
+                return False, 'Not enough arguments', []
+            tables = []
+            for input_index in range(0, len(arguments), 2):
+                match_column = self.read_match_column(arguments[input_index + 1])
+                if match_column == -1:
+                    return False, 'Bad column', []
+                tables.append((arguments[input_index], match_column))
+            if (self.server_socket is None) == (self.server_port is None):
+                return False, 'Socket or port missing', []
+            return True, '', tables
+        except Exception as e:
+            return False, 'Error in arguments', []
+
+    def read_clear_cache_argv(self, argv):
+        """Read command line arguments to only clear the cache
+
+        exec --cache-dir=DIRECTORY --clear-cache
+        """
+        self.set_default_values()
+        try:
+            result, err = self.read_options(argv)
+            if not result:
+                return result, err
+            if any('--' != arg[:2] for arg in argv[1:]):
+                return False, 'Too many arguments'
+            if self.cache_dir is None or not self.clear_cache_first:
+                return False, 'Cache directory missing'
+            return True, ''
+        except Exception as e:
+            return False, 'Error in arguments'
+
+    def read_options(self, argv):
+        """Read options in command line arguments
+
+        :return: False and the error if an option is bad
+        :rtype: Tuple
+        """
+        for arg in argv:
+            if '--' == arg[:2]:
+                option = arg[2:].split('=')[0]
+                if 'no-header' == arg[2:]:
+                    self.ignore_header = True
+                elif 'output-sheetname' in arg:
+                    self.output_sheetname = arg.split('=')[1]
+                elif 'engine' == option:
+                    self.match_engine = arg.split('=')[1]
+                    if self.match_engine not in self.MATCH_ENGINES:
+                        return False, 'Bad engine'
+                elif 'sort-merge' == option:
+                    self.match_engine = 'sort-merge'
+                elif 'memory-budget' == option:
+                    self.memory_budget = int(arg.split('=')[1])
+                    if self.memory_budget < 1:
+                        return False, 'Bad memory budget'
+                elif 'workers' == option:
+                    self.workers = int(arg.split('=')[1])
+                    if self.workers < 1:
+                        return False, 'Bad number of workers'
+                elif 'cache-dir' == option:
+                    self.cache_dir = arg.split('=', 1)[1]
+                elif 'clear-cache' == option:
+                    self.clear_cache_first = True
+                elif 'cache-size' == option:
+                    self.cache_size = int(arg.split('=')[1])
+                    if self.cache_size < 1:
+                        return False, 'Bad cache size'
+                elif 'out-dir' == option:
+                    self.out_dir = arg.split('=', 1)[1]
+                elif 'columns-1' == option:
+                    self.columns_1 = self.read_columns_option(arg.split('=', 1)[1])
+                elif 'sheets-1' == option:
+                    self.sheets_1 = arg.split('=', 1)[1]
+                elif 'sheets-2' == option:
+                    self.sheets_2 = arg.split('=', 1)[1]
+                elif 'columns-2' == option:
+                    self.columns_2 = self.read_columns_option(arg.split('=', 1)[1])
+                elif 'delimiter' == option:
+                    self.csv_delimiter = arg.split('=', 1)[1]
+                    if 'tab' == self.csv_delimiter or '\\t' == self.csv_delimiter:
+                        self.csv_delimiter = '\t'
+                    if len(self.csv_delimiter) != 1:
+                        return False, 'Bad delimiter'
+                elif 'encoding' == option:
+                    self.csv_encoding = arg.split('=', 1)[1]
+                elif 'normalize' == option:
+                    self.normalizations = arg.split('=', 1)[1].split(',') if '=' in arg else list(self.NORMALIZATIONS)
+                    for normalization in self.normalizations:
+                        if normalization not in self.NORMALIZATIONS:
+                            return False, 'Bad normalization'
+                elif 'fuzzy' == option:
+                    self.fuzzy_threshold = float(arg.split('=')[1])
+                    if self.fuzzy_threshold <= 0 or self.fuzzy_threshold > 1:
+                        return False, 'Bad fuzzy threshold'
+                elif 'prefilter' == option:
+                    self.prefilter = arg.split('=')[1]
+                    if self.prefilter not in self.PREFILTERS:
+                        return False, 'Bad prefilter'
+                elif 'rows-per-shard' == option:
+                    self.rows_per_shard = int(arg.split('=')[1])
+                    if self.rows_per_shard < 1:
+                        return False, 'Bad number of rows per shard'
+                elif 'shard-mode' == option:
+                    self.shard_mode = arg.split('=')[1]
+                    if self.shard_mode not in self.SHARD_MODES:
+                        return False, 'Bad shard mode'
+                elif 'join' == option:
+                    self.join_mode = arg.split('=')[1]
+                    if self.join_mode not in self.JOIN_MODES:
+                        return False, 'Bad join mode'
+                elif 'duplicates-1' == option:
+                    self.duplicates_1 = arg.split('=')[1]
+                    if not self.is_duplicates_policy(self.duplicates_1):
+                        return False, 'Bad duplicates policy'
+                elif 'duplicates-2' == option:
+                    self.duplicates_2 = arg.split('=')[1]
+                    if not self.is_duplicates_policy(self.duplicates_2):
+                        return False, 'Bad duplicates policy'
+                elif 'stats' == option:
+                    self.show_stats = True
+                elif 'stats-file' == option:
+                    self.stats_filename = arg.split('=', 1)[1]
+                elif 'state' == option:
+                    self.state_filename = arg.split('=', 1)[1]
+                elif 'socket' == option:
+                    self.server_socket = arg.split('=', 1)[1]
+                elif 'port' == option:
+                    self.server_port = int(arg.split('=')[1])
+                    if self.server_port < 1 or self.server_port > 65535:
+                        return False, 'Bad port'
+                elif 'progress' == option:
+                    self.progress_interval = float(arg.split('=')[1])
+                    if self.progress_interval <= 0:
+                        return False, 'Bad progress interval'
+                elif 'quoting' == option:
+                    self.csv_quoting = arg.split('=', 1)[1]
+                    if self.csv_quoting not in self.CSV_QUOTING:
+                        return False, 'Bad quoting'
+        return True, ''
+
+    def is_duplicates_policy(self, value):
+        """Test a policy for the rows with the same key
+
+        :param value: Policy
+
+        :return: True if the policy exists
+        :rtype: Boolean
+        """
+        if 'cap:' == value[:4]:
+            return value[4:].isdigit() and int(value[4:]) > 0
+        return value in self.DUPLICATES_POLICIES
+
+    def read_match_column(self, value):
+        """Read match column argument
+
+        :param value: Number of the column (start at 1), or numbers
+                      separated by commas for a key on several columns
+
+        :return: Number of the column, array of numbers, or -1 if the value is bad
+        :rtype: Integer or Array
+        """
+        columns = value.split(',')
+        if not all(column.isdigit() and int(column) > 0 for column in columns) or \
+                len(set(columns)) != len(columns):
+            return -1
+        if len(columns) == 1:
+            return int(columns[0])
+        return [int(column) for column in columns]
+
+    def read_columns_option(self, value):
+        """Read a list of columns in an option
+
+        :param value: Numbers (start at 1) or names of columns, separated by commas
+
+        :return: Numbers and names of the columns
+        :rtype: Array
+        """
+        columns = []
+        for column in value.split(','):
+            if column.isdigit():
+                if int(column) < 1:
+                    raise Exception('Error: bad column')
+                columns.append(int(column))
+            elif column != '':
+                columns.append(column)
+        return columns
+
+    def get_match_columns(self, input_number):
+        """Get the numbers of the match columns of an input
+
+        :param input_number: Number of the input, extra inputs start at 3
+
+        :return: Numbers of the match columns (start at 1)
+        :rtype: Array
+        """
+        if input_number == 1:
+            match_column = self.match_column_1
+        elif input_number == 2:
+            match_column = self.match_column_2
+        else:
+            match_column = self.extra_inputs[input_number - 3][1]
+        if isinstance(match_column, (list, tuple)):
+            return list(match_column)
+        return [match_column]
+
+    def get_match_index(self, input_number):
+        """Get the index of the match column in the rows of an input
+
+        The match columns are the first columns of the rows read with a
+        selection of columns.
+
+        :param input_number: Number of the input, extra inputs start at 3
+
+        :return: Index of the match column, or tuple of indexes for several match columns
+        :rtype: Integer or Tuple
+        """
+        match_columns = self.get_match_columns(input_number)
+        columns = self.columns_1 if input_number == 1 else self.columns_2 if input_number == 2 else None
+        if columns is not None:
+            indexes = list(range(len(match_columns)))
+        else:
+            indexes = [match_column - 1 for match_column in match_columns]
+        if len(indexes) == 1:
+            return indexes[0]
+        return tuple(indexes)
+
+    def get_key_function(self, input_number):
+        """Get the function which extract the match key of a row
+
+        :param input_number: Number of the input, extra inputs start at 3
+
+        :return: Function which return the key of a row
+        :rtype: Function
+        """
+        return self.build_key_function(self.get_match_index(input_number))
+
+    def build_key_function(self, match_index):
+        """Build the function which extract the match key of a row
+
+        :param match_index: Index of the match column, or tuple of indexes
+
+        :return: Function which return the key of a row
+        :rtype: Function
+        """
+        if isinstance(match_index, tuple):
+            # Key on several columns
+            get_key = operator.itemgetter(*match_index)
+            if not self.normalizations:
+                return get_key
+            normalize_key = self.normalize_key
+            return lambda row: tuple(normalize_key(value) for value in get_key(row))
+        get_key = operator.itemgetter(match_index)
+        if not self.normalizations:
+            return get_key
+        normalize_key = self.normalize_key
+        return lambda row: normalize_key(get_key(row))
+
+    def normalize_key(self, value):
+        """Normalize a match key with the normalizations of the matcher
+
+        :param value: Value of the match column
+
+        :return: Normalized value
+        :rtype: Any
+        """
+        if isinstance(value, str):
+            if 'accents' in self.normalizations:
+                value = ''.join(character for character in unicodedata.normalize('NFKD', value)
+                                if not unicodedata.combining(character))
+            if 'case' in self.normalizations:
+                value = value.casefold()
+            if 'space' in self.normalizations:
+                value = ' '.join(value.split())
+            if 'numbers' in self.normalizations:
+                try:
+                    number = float(value)
+                    if math.isfinite(number):
+                        value = number
+                except ValueError:
+                    pass
+        # Same key for 320988, 320988.0 and '320988'
+        if 'numbers' in self.normalizations and isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return value
+
+    def get_input_columns(self, input_number):
+        """Get the columns to read in an input file
+
+        :param input_number: Number of the input (1 or 2)
+
+        :return: Match column then selected columns, or None to read all the columns
+        :rtype: Array
+        """
+        if input_number == 1 and self.columns_1 is not None:
+            return self.get_match_columns(1) + self.columns_1
+        elif input_number == 2 and self.columns_2 is not None:
+            return self.get_match_columns(2) + self.columns_2
+        return None
+
+    def get_column_indexes(self, header, columns):
+        """Get the indexes of columns in rows
+
+        :param header: First row
+        :param columns: Numbers of the columns (start at 1) or names in the header
+
+        :return: Indexes of the columns, without duplicates
+        :rtype: Array
+        """
+        indexes = []
+        for column in columns:
+            if isinstance(column, int):
+                column_index = column - 1
+            elif column in header:
+                column_index = list(header).index(column)
+            else:
+                raise Exception('Error: column ' + str(column) + ' not found')
+            if column_index not in indexes:
+                indexes.append(column_index)
+        return indexes
+
+    def project_rows(self, rows, columns):
+        """Keep only some columns of rows
+
+        :param rows: Rows, the first one is the header
+        :param columns: Numbers of the columns (start at 1) or names in the header
+
+        :return: Generator of the rows with the columns, in compact tuples
+        :rtype: Generator
+        """
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        indexes = self.get_column_indexes(header, columns)
+
+        def get_columns(row):
+            # Missing cells at the end of a row are empty
+            return tuple(row[column_index] if column_index < len(row) else None for column_index in indexes)
+
+        yield get_columns(header)
+        if len(indexes) > 1:
+            getter = operator.itemgetter(*indexes)
+        else:
+            getter = lambda row: (row[indexes[0]],)
+        max_index = max(indexes)
+        for row in rows:
+            if len(row) > max_index:
+                yield getter(row)
+            else:
+                yield get_columns(row)
+
+    def merge_rows(self, input_1, input_2, match_column_1, match_column_2):
+        """Merge 2 matched rows
+
+        :param input_1: Row of the first input
+        :param input_2: Row of the second input
+        :param match_column_1: Index of the match column in the first row, or tuple of indexes
+        :param match_column_2: Index of the match column in the second row, or tuple of indexes
+
+        :return: Matched data, then the other columns of the 2 rows
+        :rtype: Array
+        """
+        if isinstance(match_column_1, tuple) or isinstance(match_column_2, tuple):
+            match_columns_1 = match_column_1 if isinstance(match_column_1, tuple) else (match_column_1,)
+            match_columns_2 = match_column_2 if isinstance(match_column_2, tuple) else (match_column_2,)
+            row = [input_1[column_index] for column_index in match_columns_1]
+            row.extend(col for column_index, col in enumerate(input_1) if column_index not in match_columns_1)
+            row.extend(col for column_index, col in enumerate(input_2) if column_index not in match_columns_2)
+            return row
+        row = [input_1[match_column_1]]
+        row.extend(input_1[:match_column_1])
+        row.extend(input_1[match_column_1 + 1:])
+        row.extend(input_2[:match_column_2])
+        row.extend(input_2[match_column_2 + 1:])
+        return row
+
+    def build_index(self, rows, key_function):
+        """Build the index of rows on their match key
+
+        :param rows: Rows to index
+        :param key_function: Function which return the key of a row
+
+        :return: Rows grouped by key, in input order
+        :rtype: Dict
+        """
+        index = {}
+        for row in rows:
+            key = key_function(row)
+            rows_with_key = index.get(key)
+            if rows_with_key is None:
+                index[key] = [row]
+            else:
+                rows_with_key.append(row)
+        if self.stats is not None:
+            self.update_stats(index_keys = len(index), index_rows = sum(len(rows_with_key) for rows_with_key in index.values()),
+                              duplicate_keys = sum(1 for rows_with_key in index.values() if len(rows_with_key) > 1))
+        return index
+
+    def iter_unique_rows(self, rows, input_number):
+        """Apply the policy of an input to the rows with the same key
+
+        - first, cap:K and error keep the first rows of each key while the
+          rows are read.
+        - last, concat and aggregate group the rows by key, in the order of
+          the first row of each key. concat joins the different values of
+          the other columns, aggregate adds the numbers and joins the other
+          values.
+        The number of keys with removed or merged rows is added to the
+        statistics.
+
+        :param rows: Rows of the input, with the header
+        :param input_number: Number of the input (1 or 2)
+
+        :return: Generator of the rows, with the header
+        :rtype: Generator
+        """
+        policy = self.duplicates_1 if input_number == 1 else self.duplicates_2
+        key_function = self.get_key_function(input_number)
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield header
+        counts = {}
+        if policy in ['first', 'error'] or 'cap:' == policy[:4]:
+            max_rows = int(policy[4:]) if 'cap:' == policy[:4] else 1
+            for row in rows:
+                key = key_function(row)
+                count = counts.get(key, 0) + 1
+                counts[key] = count
+                if count <= max_rows:
+                    yield row
+                elif 'error' == policy:
+                    raise Exception('Error: duplicated key in input ' + str(input_number) + ': ' + str(key))
+        else:
+            match_index = self.get_match_index(input_number)
+            match_columns = match_index if isinstance(match_index, tuple) else (match_index,)
+            grouped_rows = {}
+            for row in rows:
+                key = key_function(row)
+                count = counts.get(key, 0) + 1
+                counts[key] = count
+                if count == 1 or 'last' == policy:
+                    grouped_rows[key] = row
+                    continue
+                grouped_row = list(grouped_rows[key])
+                for col_index, col in enumerate(row):
+                    if col_index in match_columns:
+                        continue
+                    if col_index >= len(grouped_row):
+                        grouped_row.append(col)
+                    else:
+                        grouped_row[col_index] = merge_values(grouped_row[col_index], col, 'aggregate' == policy)
+                grouped_rows[key] = grouped_row
+            yield from grouped_rows.values()
+        self.update_stats(**{'duplicate_keys_resolved_' + str(input_number): sum(1 for count in counts.values() if count > 1)})
+
+    def build_prefilter(self, rows, input_number):
+        """Build the set of the keys of an input, exact or bloom filter
+
+        :param rows: Iterable of the rows of the input, with the header
+        :param input_number: Number of the input (1 or 2)
+
+        :return: Set of the keys, which support the in operator
+        :rtype: Set or BloomFilter
+        """
+        if self.fuzzy_threshold is not None:
+            raise Exception('Error: prefilter needs exact keys')
+        rows = iter(rows)
+        next(rows, None)
+        keys = map(self.get_key_function(input_number), rows)
+        if 'set' == self.prefilter:
+            return set(keys)
+        # The size of the bloom filter depends on the number of keys
+        keys = list(keys)
+        bloom_filter = BloomFilter(len(keys), self.BLOOM_ERROR_RATE)
+        for key in keys:
+            bloom_filter.add(key)
+        return bloom_filter
+
+    def filter_rows(self, rows, keys, input_number):
+        """Keep the rows of an input with a key in a set, while they are read
+
+        :param rows: Iterable of the rows of the input, with the header
+        :param keys: Set returned by build_prefilter
+        :param input_number: Number of the input (1 or 2)
+
+        :return: Generator of the rows, with the header
+        :rtype: Generator
+        """
+        key_function = self.get_key_function(input_number)
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield header
+        discarded = 0
+        for row in rows:
+            if key_function(row) in keys:
+                yield row
+            else:
+                discarded += 1
+        self.update_stats(prefiltered_rows = discarded)
+
+    def build_match_index(self, rows, key_function):
+        """Build the index used to match rows, fuzzy if a threshold is set
+
+        :param rows: Rows to index
+        :param key_function: Function which return the key of a row
+
+        :return: Index with a get method, which return rows of a key in input order
+        :rtype: Dict or FuzzyIndex
+        """
+        if self.fuzzy_threshold is None:
+            return self.build_index(rows, key_function)
+        index = FuzzyIndex(rows, key_function, self.fuzzy_threshold)
+        self.update_stats(index_keys = len(index), index_rows = index.rows_count)
+        return index
+
     def match(self):
         """Match on 2 columns and merge data
 
         :return: Merged data
         :rtype: Array
         """
-        output_data = []
-        match_column_1 = self.match_column_1 - 1
-        match_column_2 = self.match_column_2 - 1
-        # Copy header
+        return list(self.iter_match())
+
+    def iter_match(self):
+        """Match on 2 columns and merge data row by row
+
+        :return: Generator of the merged rows
+        :rtype: Generator
+        """
+        if self.fuzzy_threshold is not None and (self.match_engine != 'hash' or self.match_index is not None):
+            raise Exception('Error: fuzzy match needs the hash engine without index file')
+        self.apply_duplicates_policies()
+        if self.match_index is not None:
+            return self.iter_match_hash()
+        elif self.match_engine == 'hash':
+            return self.iter_match_hash()
+        elif self.match_engine == 'nested':
+            return self.iter_match_nested_loop()
+        elif self.match_engine == 'sort-merge':
+            return self.iter_match_sort_merge()
+        raise Exception('Error: unknown match engine')
+
+    def iter_match_join(self):
+        """Match on 2 columns and route the rows by join mode, in one pass
+
+        - left: merged rows, then rows of the first input without match.
+        - right: merged rows, then rows of the second input without match.
+        - full: merged rows, then rows of both inputs without match.
+        - anti: only the rows of the first input without match.
+        Unmatched rows of the first input are kept in a temporary file above
+        the memory budget. Unmatched rows of each input have their own
+        header, and must be read after the main rows.
+
+        :return: Main rows, and array of tuples (name, unmatched rows)
+        :rtype: Tuple
+        """
+        if self.match_engine != 'hash' or self.fuzzy_threshold is not None:
+            raise Exception('Error: join modes need the hash engine and exact keys')
+        if self.match_index is not None and self.join_mode in ['right', 'full']:
+            raise Exception('Error: right and full join modes need the second input file')
+        self.apply_duplicates_policies()
+        memory_budget = self.memory_budget * 1024 * 1024
+        unmatched_1 = SpillBuffer(memory_budget) if self.join_mode in ['left', 'full', 'anti'] else None
+        unmatched_2 = SpillBuffer(memory_budget) if self.join_mode in ['right', 'full'] else None
+        output_data = self.iter_match_hash(unmatched_1, unmatched_2)
+        if 'anti' == self.join_mode:
+            def iter_unmatched_rows():
+                for row in output_data:
+                    pass
+                yield from unmatched_1
+            return iter_unmatched_rows(), []
+        other_sheets = []
+        if unmatched_1 is not None:
+            other_sheets.append(('unmatched_1', unmatched_1))
+        if unmatched_2 is not None:
+            other_sheets.append(('unmatched_2', unmatched_2))
+        return output_data, other_sheets
+
+    def groups_duplicates(self, input_number):
+        """Test if the policy of an input for duplicated keys groups all its rows by key
+
+        :param input_number: Number of the input (1 or 2)
+
+        :return: True for last, concat and aggregate
+        :rtype: Boolean
+        """
+        return (self.duplicates_1 if input_number == 1 else self.duplicates_2) in ['last', 'concat', 'aggregate']
+
+    def apply_duplicates_policies(self):
+        """Apply the policies for duplicated keys to the input data
+
+        Policies which group the rows by key apply only to an input kept in
+        memory, an input read as a stream is never loaded in memory.
+        """
+        for input_number in [1, 2] if self.match_index is None else [1]:
+            if 'all' != (self.duplicates_1 if input_number == 1 else self.duplicates_2):
+                input_data = self.input_data_1 if input_number == 1 else self.input_data_2
+                if self.groups_duplicates(input_number) and not isinstance(input_data, list):
+                    if 'hash' == self.match_engine and input_number == 2 and not isinstance(self.input_data_1, list):
+                        # The second input is indexed when both inputs are streams
+                        input_data = list(input_data)
+                    else:
+                        raise Exception('Error: duplicates policy ' + (self.duplicates_1 if input_number == 1 else self.duplicates_2) +
+                                        ' of input ' + str(input_number) + ' needs the input indexed in memory by the hash engine')
+                unique_rows = self.iter_unique_rows(input_data, input_number)
+                if isinstance(input_data, list):
+                    unique_rows = list(unique_rows)
+                if input_number == 1:
+                    self.input_data_1 = unique_rows
+                else:
+                    self.input_data_2 = unique_rows
+
+    def match_header(self, header_1, header_2):
+        """Merge the headers of the 2 inputs
+
+        :param header_1: First row of the first input
+        :param header_2: First row of the second input
+
+        :return: Merged header, or an empty array without header
+        :rtype: Array
+        """
+        if self.ignore_header or header_1 is None or header_2 is None:
+            return []
+        return [self.merge_rows(header_1, header_2, self.get_match_index(1), self.get_match_index(2))]
+
+    def iter_match_hash(self, unmatched_1 = None, unmatched_2 = None):
+        """Match on 2 columns with an index of the smallest input
+
+        Inputs can be arrays or iterables of rows. If only one input is an
+        array, this one is indexed and the other one is read once as a
+        stream. Rows are merged in the order of the first input, then in the
+        order of the second input for duplicated keys.
+
+        Rows without match are added to the unmatched arrays while the
+        indexed rows are marked, after their header. Unmatched rows of the
+        indexed input are added at the end, grouped by key.
+
+        :param unmatched_1: Array for the rows of the first input without match, or None
+        :param unmatched_2: Array for the rows of the second input without match, or None
+
+        :return: Generator of the merged rows
+        :rtype: Generator
+        """
+        match_column_1 = self.get_match_index(1)
+        match_column_2 = self.get_match_index(2)
+        key_1 = self.get_key_function(1)
+        key_2 = self.get_key_function(2)
+        index_first_input = isinstance(self.input_data_1, list) and \
+            (not isinstance(self.input_data_2, list) or len(self.input_data_1) < len(self.input_data_2))
+        rows_1 = iter(self.input_data_1)
+        if self.match_index is not None:
+            # Index of the second input loaded from an index file
+            header_1 = next(rows_1, None)
+            if unmatched_1 is not None and header_1 is not None and not self.ignore_header:
+                unmatched_1.append(header_1)
+            yield from self.match_header(header_1, self.match_index.header)
+            index = self.match_index
+            self.update_stats(index_keys = len(index))
+            matched = unmatched = 0
+            for input_1 in rows_1:
+                rows_matched = index.get(key_1(input_1))
+                if rows_matched is None:
+                    unmatched += 1
+                    if unmatched_1 is not None:
+                        unmatched_1.append(input_1)
+                    continue
+                matched += 1
+                for input_2 in rows_matched:
+                    yield self.merge_rows(input_1, input_2, match_column_1, match_column_2)
+            self.update_stats(matched_rows = matched, unmatched_rows = unmatched)
+            return
+        rows_2 = iter(self.input_data_2)
+        header_1 = next(rows_1, None)
+        header_2 = next(rows_2, None)
         if not self.ignore_header:
-            row = []
-            row.append(self.input_data_1[0][match_column_1])
-            for index, col in enumerate(self.input_data_1[0]):
-                if index != match_column_1:
-                    row.append(col)
-            for index, col in enumerate(self.input_data_2[0]):
-                if index != match_column_2:
-                    row.append(col)
-            output_data.append(row)
-        for index_1, input_1 in enumerate(self.input_data_1):
-            if index_1 > 0:
-                for index_2, input_2 in enumerate(self.input_data_2):
-                    # Match columns
-                    if index_2 > 0 and input_1[match_column_1] == input_2[match_column_2]:
-                        # Merge the 2 inputs
-                        row = []
-                        # Matched data
-                        row.append(input_1[match_column_1])
-                        # Input 1 row data
-                        for index, col in enumerate(input_1):
-                            if index != match_column_1:
-                                row.append(col)
-                        # Input 2 row data
-                        for index, col in enumerate(input_2):
-                            if index != match_column_2:
-                                row.append(col)
-                        output_data.append(row)
-        return output_data
-    
-    def start(self, input1_filename, input2_filename, output_filename):
-        self.input_data_1 = []
-        self.input_data_2 = []
+            if unmatched_1 is not None and header_1 is not None:
+                unmatched_1.append(header_1)
+            if unmatched_2 is not None and header_2 is not None:
+                unmatched_2.append(header_2)
+        yield from self.match_header(header_1, header_2)
+        if not index_first_input:
+            # Index the second input and probe it with the first one
+            index = self.build_match_index(rows_2, key_2)
+            matched_keys = set()
+            matched = unmatched = 0
+            for input_1 in rows_1:
+                key = key_1(input_1)
+                rows_matched = index.get(key)
+                if rows_matched is None:
+                    unmatched += 1
+                    if unmatched_1 is not None:
+                        unmatched_1.append(input_1)
+                    continue
+                matched += 1
+                if unmatched_2 is not None:
+                    matched_keys.add(key)
+                for input_2 in rows_matched:
+                    yield self.merge_rows(input_1, input_2, match_column_1, match_column_2)
+            self.update_stats(matched_rows = matched, unmatched_rows = unmatched)
+            if unmatched_2 is not None:
+                unmatched = 0
+                for key, rows_with_key in index.items():
+                    if key not in matched_keys:
+                        unmatched += len(rows_with_key)
+                        for input_2 in rows_with_key:
+                            unmatched_2.append(input_2)
+                self.update_stats(unmatched_rows_2 = unmatched)
+        else:
+            # Index the first input, then keep the matches of each row of
+            # the first input to merge them in the same order
+            rows_1 = list(rows_1)
+            index = self.build_match_index(range(len(rows_1)), lambda row_index: key_1(rows_1[row_index]))
+            matches = [None] * len(rows_1)
+            unmatched = 0
+            for input_2 in rows_2:
+                row_indexes = index.get(key_2(input_2), ())
+                if not row_indexes:
+                    unmatched += 1
+                    if unmatched_2 is not None:
+                        unmatched_2.append(input_2)
+                for row_index in row_indexes:
+                    if matches[row_index] is None:
+                        matches[row_index] = [input_2]
+                    else:
+                        matches[row_index].append(input_2)
+            matched = 0
+            for input_1, rows_matched in zip(rows_1, matches):
+                if rows_matched is not None:
+                    matched += 1
+                    for input_2 in rows_matched:
+                        yield self.merge_rows(input_1, input_2, match_column_1, match_column_2)
+                elif unmatched_1 is not None:
+                    unmatched_1.append(input_1)
+            self.update_stats(matched_rows = matched, unmatched_rows = len(rows_1) - matched)
+            if unmatched_2 is not None:
+                self.update_stats(unmatched_rows_2 = unmatched)
 
-        # Test if input files exists
-        if not os.path.exists(input1_filename) or not os.path.exists(input2_filename):
-            raise Exception('Error: input file missing')
+    def iter_match_multi(self, inputs):
+        """Match several inputs on their match columns and merge data row by row
+
+        The first input is read once as a stream, the other inputs are
+        indexed. Merged rows have the match columns of the first input, then
+        the other columns of each input.
+
+        :param inputs: Array of tuples (rows, match index), with the index
+                       of the match column in the rows (start at 0) or a
+                       tuple of indexes
+
+        :return: Generator of the merged rows
+        :rtype: Generator
+        """
+        rows_1, match_index_1 = inputs[0]
+        rows_1 = iter(rows_1)
+        key_1 = self.build_key_function(match_index_1)
+        headers = [next(rows_1, None)]
+        indexes = []
+        match_indexes = [match_index_1]
+        for rows, match_index in inputs[1:]:
+            rows = iter(rows)
+            headers.append(next(rows, None))
+            indexes.append(self.build_match_index(rows, self.build_key_function(match_index)))
+            match_indexes.append(match_index)
+        if not self.ignore_header and None not in headers:
+            yield self.merge_many_rows(headers, match_indexes)
+        matched = unmatched = 0
+        for input_1 in rows_1:
+            key = key_1(input_1)
+            rows_matched = [index.get(key) for index in indexes]
+            if None in rows_matched:
+                unmatched += 1
+                continue
+            matched += 1
+            for other_inputs in itertools.product(*rows_matched):
+                yield self.merge_many_rows((input_1,) + other_inputs, match_indexes)
+        self.update_stats(matched_rows = matched, unmatched_rows = unmatched)
+
+    def merge_many_rows(self, rows, match_indexes):
+        """Merge matched rows of several inputs
+
+        :param rows: Rows of the inputs
+        :param match_indexes: Index of the match column in each row, or tuple of indexes
+
+        :return: Matched data of the first row, then the other columns of the rows
+        :rtype: Array
+        """
+        row = self.merge_rows(rows[0], rows[1], match_indexes[0], match_indexes[1])
+        for other_row, match_index in zip(rows[2:], match_indexes[2:]):
+            match_columns = match_index if isinstance(match_index, tuple) else (match_index,)
+            row.extend(col for column_index, col in enumerate(other_row) if column_index not in match_columns)
+        return row
+
+    def match_files_partitioned(self, input1_filename, input2_filename, output_filename):
+        """Match input files on 2 columns with the hash engine in several processes
+
+        The rows of both inputs are partitioned on a hash of their key: the
+        CSV files are split in ranges of rows, and worker processes read the
+        ranges and write the rows of each partition in temporary files. Then
+        each worker indexes the rows of the second input of one partition,
+        matches the rows of the first input of this partition, and writes
+        the CSV text of the merged rows of each row with its position. The
+        merged rows are written in the order of the hash engine, range by
+        range of the first input.
+
+        :param input1_filename: Path of the first input file, a CSV file
+        :param input2_filename: Path of the second input file, a CSV file
+        :param output_filename: Path of the output file, a CSV or TSV file
+        """
+        settings = {}
+        for name in ['match_column_1', 'match_column_2', 'columns_1', 'columns_2', 'normalizations',
+                     'csv_encoding', 'csv_quoting', 'csv_delimiter', 'duplicates_2']:
+            settings[name] = getattr(self, name)
+        output_delimiter = self.csv_delimiter or ('\t' if '.tsv' in output_filename else ',')
+        partitions_count = self.workers
+        with tempfile.TemporaryDirectory() as temporary_directory, \
+                concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # Rows of each partition in each range of the inputs
+            headers = []
+            parts = []
+            for input_number, input_filename in [(1, input1_filename), (2, input2_filename)]:
+                self.start_phase('read_' + str(input_number))
+                delimiter, header, ranges = self.split_csv_file(input_filename, self.workers)
+                futures = [executor.submit(partition_input_range, settings, input_number, input_filename, header, start, end,
+                                           delimiter, partitions_count, temporary_directory) for start, end in ranges]
+                headers.append(header)
+                parts.append([future.result() for future in futures])
+            parts_1, parts_2 = parts
+
+            self.start_phase('match')
+            results = [executor.submit(match_partition, settings, headers[0], headers[1],
+                                       [(part['filename'], part['offsets'][partition]) for part in parts_1],
+                                       [(part['filename'], part['offsets'][partition]) for part in parts_2],
+                                       output_delimiter, temporary_directory) for partition in range(partitions_count)]
+            results = [future.result() for future in results]
+
+            self.start_phase('write')
+            with open(output_filename, 'w', newline='', encoding=self.csv_encoding) as output_file:
+                columns_1 = self.get_input_columns(1)
+                columns_2 = self.get_input_columns(2)
+                header = self.match_header(headers[0] if columns_1 is None else next(self.project_rows([headers[0]], columns_1)),
+                                           headers[1] if columns_2 is None else next(self.project_rows([headers[1]], columns_2)))
+                csv.writer(output_file, delimiter=output_delimiter, quoting=self.CSV_QUOTING[self.csv_quoting]).writerows(header)
+                for range_index in range(len(parts_1)):
+                    merged_rows = []
+                    for result in results:
+                        merged_rows.extend(read_partition(result['filename'], result['offsets'][range_index]))
+                    merged_rows.sort(key=operator.itemgetter(0))
+                    output_file.writelines(text for position, text in merged_rows)
+        self.start_phase(None)
+        rows_count_1 = sum(part['rows_count'] for part in parts_1)
+        matched = sum(result['matched_rows'] for result in results)
+        self.update_stats(rows_read_1 = rows_count_1 + 1, rows_read_2 = sum(part['rows_count'] for part in parts_2) + 1,
+                          matched_rows = matched, unmatched_rows = rows_count_1 - matched,
+                          output_rows = sum(result['output_rows'] for result in results) + len(header))
 
-        # Read data from the first file
-        if '.xlsx' in input1_filename:
-            self.input_data_1 = self.read_input_data_from_xlsx(input1_filename)
-        elif '.xls' in input1_filename:
-            self.input_data_1 = self.read_input_data_from_xls(input1_filename)
+    def can_match_partitioned(self, input1_filename, input2_filename, output_filename):
+        """Test if input files can be matched by match_files_partitioned
 
-        # Read data from the second file
-        if '.xlsx' in input2_filename:
-            self.input_data_2 = self.read_input_data_from_xlsx(input2_filename)
-        elif '.xls' in input2_filename:
-            self.input_data_2 = self.read_input_data_from_xls(input2_filename)
+        :param input1_filename: Path of the first input file
+        :param input2_filename: Path of the second input file
+        :param output_filename: Path of the output file
+
+        :return: True with the hash engine on exact keys and the inner join,
+                 CSV input files whose rows can be split, and a CSV or TSV
+                 output without shards
+        :rtype: Boolean
+        """
+        if ('.csv' not in output_filename and '.tsv' not in output_filename) or self.rows_per_shard is not None:
+            return False
+        if self.match_engine != 'hash' or self.fuzzy_threshold is not None or self.match_index is not None or \
+                self.extra_inputs or 'inner' != self.join_mode or 'all' != self.duplicates_1:
+            return False
+        return self.is_csv_file(input1_filename) and self.is_csv_file(input2_filename)
+
+    def split_csv_file(self, input_filename, ranges_count):
+        """Split the rows of a CSV file in ranges of bytes
 
-        if self.input_data_1 == [] or self.input_data_2 == [] or self.input_data_1 == [[None]] or self.input_data_2 == [[None]]:
+        A line break ends a row when it is out of quoted values, that is
+        after an even number of quotes since the start of the row. Ranges
+        are at most RANGE_SIZE bytes, except for long rows.
+
+        :param input_filename: Path of the CSV file
+        :param ranges_count: Minimum number of ranges of a big enough file
+
+        :return: Delimiter of the columns, header, and array of tuples
+                 (start, end) of the ranges of the other rows, at least one
+        :rtype: Tuple
+        """
+        size = os.path.getsize(input_filename)
+        if size == 0:
             raise Exception('Error: no data')
+        check_quotes = 'none' != self.csv_quoting
 
-        # Start process
-        output_data = self.match()
-        if '.xlsx' in output_filename:
-            self.write_output_data_to_xlsx(output_filename, output_data, self.output_sheetname)
-        elif '.xls' in output_filename:
-            self.write_output_data_to_xls(output_filename, output_data, self.output_sheetname)
-    
-def usage(exec_name):
-    """Show usage for help.
-    :param exec_name: Path of this script
-    """
+        with open(input_filename, 'rb') as input_file, mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            def find_row_end(row_start, position):
+                # First line break at or after position which ends a row
+                quotes = data[row_start:position].count(b'"') if check_quotes else 0
+                while True:
+                    line_end = data.find(b'\n', position)
+                    if line_end < 0:
+                        return size
+                    if check_quotes:
+                        quotes += data[position:line_end].count(b'"')
+                    if quotes % 2 == 0:
+                        return line_end + 1
+                    position = line_end + 1
 
-    # Get only executable name without the path
-    if os.path.sep in exec_name:
-        exec_name = exec_name.split(os.path.sep)[-1:][0]
-        
-    print(exec_name+" [options] input_file_1 match_column_1 input_file_2 match_column_2 output_file")
-    print("Options : ")
-    print(" --no-header")
-    print(" --output-sheetname=SHEETNAME")
-    
-# Entry point
-if __name__ == '__main__':
-    argv = sys.argv
-    matcher = Matcher()
-    result, err = matcher.read_argv(argv)
-    if result:
-        nb_args = len(argv)
-        matcher.start(argv[nb_args - 5], argv[nb_args - 3], argv[nb_args - 1])
-    else:
-        usage(argv[0])
+            header_end = find_row_end(0, 0)
+            encoding = 'utf-8-sig' if self.csv_encoding.lower() in ['utf-8', 'utf8'] else self.csv_encoding
+            header_text = data[:header_end].decode(encoding)
+            range_size = min(self.RANGE_SIZE, max(1, (size - header_end) // ranges_count))
+            ranges = []
+            start = header_end
+            while start < size:
+                end = find_row_end(start, min(start + range_size, size) - 1)
+                ranges.append((start, end))
+                start = end
+        delimiter = self.csv_delimiter
+        if delimiter is None:
+            delimiter = '\t' if '\t' in header_text.split('\n', 1)[0] else ','
+        header = next(csv.reader(io.StringIO(header_text, newline=''), delimiter=delimiter,
+                                 quoting=self.CSV_QUOTING[self.csv_quoting]), None)
+        if header is None:
+            raise Exception('Error: no data')
+        return delimiter, header, ranges or [(size, size)]
+
+    def iter_match_nested_loop(self):
+        """Match on 2 columns by comparing each row of the inputs
+
+        Slow, kept to check the results of the other engines.
+
+        :return: Generator of the merged rows
+        :rtype: Generator
+        """
+        match_column_1 = self.get_match_index(1)
+        match_column_2 = self.get_match_index(2)
+        key_1 = self.get_key_function(1)
+        key_2 = self.get_key_function(2)
+        rows_1 = iter(self.input_data_1)
+        rows_2 = list(self.input_data_2)
+        yield from self.match_header(next(rows_1, None), rows_2[0] if rows_2 else None)
+        keys_2 = [key_2(input_2) for input_2 in rows_2[1:]]
+        matched = unmatched = 0
+        for input_1 in rows_1:
+            found = False
+            key = key_1(input_1)
+            for index_2, input_2 in enumerate(rows_2):
+                # Match columns
+                if index_2 > 0 and key == keys_2[index_2 - 1]:
+                    found = True
+                    yield self.merge_rows(input_1, input_2, match_column_1, match_column_2)
+            if found:
+                matched += 1
+            else:
+                unmatched += 1
+        self.update_stats(matched_rows = matched, unmatched_rows = unmatched)
+
+    def iter_match_sort_merge(self):
+        """Match on 2 columns by sorting the inputs on their match column
+
+        Inputs are sorted in temporary files, then merged as 2 streams. The
+        merged rows are sorted back to the order of the hash engine. The
+        memory used is bounded by the memory budget, shared by the 3 sorts.
+
+        :return: Generator of the merged rows
+        :rtype: Generator
+        """
+        match_column_1 = self.get_match_index(1)
+        match_column_2 = self.get_match_index(2)
+        key_1 = self.get_key_function(1)
+        key_2 = self.get_key_function(2)
+        memory_budget = self.memory_budget * 1024 * 1024 // 3
+        rows_1 = iter(self.input_data_1)
+        rows_2 = iter(self.input_data_2)
+        yield from self.match_header(next(rows_1, None), next(rows_2, None))
+
+        sorted_1 = self.external_sort(((sort_key(key_1(row)), row_index, row) for row_index, row in enumerate(rows_1)), memory_budget)
+        sorted_2 = self.external_sort(((sort_key(key_2(row)), row_index, row) for row_index, row in enumerate(rows_2)), memory_budget)
+
+        def iter_merged():
+            # Only the rows of the second input with the current key are kept
+            group_key = None
+            group = []
+            matched = unmatched = 0
+            record_2 = next(sorted_2, None)
+            for key, row_index_1, input_1 in sorted_1:
+                if key != group_key:
+                    group_key = key
+                    group = []
+                    while record_2 is not None and record_2[0] < key:
+                        record_2 = next(sorted_2, None)
+                    while record_2 is not None and record_2[0] == key:
+                        group.append(record_2)
+                        record_2 = next(sorted_2, None)
+                if group:
+                    matched += 1
+                else:
+                    unmatched += 1
+                for record_key, row_index_2, input_2 in group:
+                    yield row_index_1, row_index_2, self.merge_rows(input_1, input_2, match_column_1, match_column_2)
+            self.update_stats(matched_rows = matched, unmatched_rows = unmatched)
+
+        for row_index_1, row_index_2, row in self.external_sort(iter_merged(), memory_budget):
+            yield row
+
+    def external_sort(self, records, memory_budget):
+        """Sort records with temporary files when they don't fit in memory
+
+        :param records: Iterable of tuples, the last item is the row
+        :param memory_budget: Memory for the records in memory, in bytes
+
+        :return: Iterator of the sorted records
+        :rtype: Iterator
+        """
+        runs = []
+        buffer = []
+        buffer_size = 0
+        for record in records:
+            buffer.append(record)
+            buffer_size += row_size(record[-1])
+            if buffer_size > memory_budget:
+                runs.append(self.spill_records(sorted(buffer)))
+                buffer = []
+                buffer_size = 0
+        buffer.sort()
+        if not runs:
+            return iter(buffer)
+        if buffer:
+            runs.append(self.spill_records(buffer))
+        return heapq.merge(*[self.iter_spilled_records(run) for run in runs])
+
+    def spill_records(self, records):
+        """Write sorted records in a temporary file
+
+        :param records: Sorted records
+
+        :return: Temporary file, removed when closed
+        :rtype: File
+        """
+        spill_file = tempfile.TemporaryFile()
+        for start in range(0, len(records), self.SPILL_CHUNK_SIZE):
+            pickle.dump(records[start:start + self.SPILL_CHUNK_SIZE], spill_file, pickle.HIGHEST_PROTOCOL)
+        spill_file.seek(0)
+        return spill_file
+
+    def iter_spilled_records(self, spill_file):
+        """Read the records of a temporary file
+
+        :param spill_file: Temporary file written by spill_records
+
+        :return: Generator of the records
+        :rtype: Generator
+        """
+        with spill_file:
+            while True:
+                try:
+                    chunk = pickle.load(spill_file)
+                except EOFError:
+                    return
+                yield from chunk
+
+    def add_listener(self, listener):
+        """Add a function called on the events of the process
+
+        The function is called with the name of the event and its data:
+        - phase: start of a phase (read_1, read_2, match, write or None at the end)
+        - progress: counters and rows read per second, every progress_interval seconds
+        - stats: all the statistics, at the end of the process
+
+        :param listener: Function with 2 parameters, event and data
+        """
+        self.listeners.append(listener)
+
+    def emit(self, event, data):
+        """Call the listeners with an event
+
+        :param event: Name of the event
+        :param data: Data of the event
+        """
+        for listener in self.listeners:
+            listener(event, data)
+
+    def update_stats(self, **counters):
+        """Add values to the counters of the statistics, if they are enabled
+
+        :param counters: Values to add by counter name
+        """
+        if self.stats is not None:
+            for counter, value in counters.items():
+                self.stats.counters[counter] = self.stats.counters.get(counter, 0) + value
+
+    def iter_with_stats(self, rows, phase, counter):
+        """Count rows and time spent to produce them
+
+        Rows are read by chunks of STATS_CHUNK_ROWS rows, the phase is
+        switched and the progress is checked once per chunk.
 
+        :param rows: Iterable of rows
+        :param phase: Phase of the time spent in the iterable
+        :param counter: Counter of the rows
+
+        :return: Generator of the rows
+        :rtype: Generator
+        """
+        stats = self.stats
+        counters = stats.counters
+        rows = iter(rows)
+        while True:
+            previous_phase = stats.switch_phase(phase)
+            try:
+                chunk = list(itertools.islice(rows, self.STATS_CHUNK_ROWS))
+            finally:
+                stats.switch_phase(previous_phase)
+            if not chunk:
+                return
+            counters[counter] = counters.get(counter, 0) + len(chunk)
+            if stats.is_progress_due(self.progress_interval):
+                self.emit('progress', stats.get_progress())
+            yield from chunk
+
+    def print_stats(self, event, data):
+        """Print progress and statistics on the error output
+
+        :param event: Name of the event
+        :param data: Data of the event
+        """
+        if 'progress' == event:
+            print('%(elapsed).1fs: %(rows_read_1)d + %(rows_read_2)d rows read, %(output_rows)d rows written, %(rows_per_second).0f rows/s' % data,
+                  file=sys.stderr)
+        elif 'stats' == event:
+            for phase, times in data['phases'].items():
+                print('%s: %.3fs wall, %.3fs cpu' % (phase, times['wall'], times['cpu']), file=sys.stderr)
+            for counter, value in data['counters'].items():
+                print('%s: %s' % (counter, value), file=sys.stderr)
+            print('elapsed: %.3fs' % data['elapsed'], file=sys.stderr)
+            print('peak_rss: %s' % data['peak_rss'], file=sys.stderr)
+
+    def iter_input_data(self, input_filename, columns = None, sheets = None):
+        """Read input data of a file as a stream of rows
+
+        Rows are read from the cache if a cache directory is set. The input
+        can be a glob of files and a selection of sheets, read as one table:
+        the parts are read in parallel threads and their rows follow each
+        other, with the header of the first part only.
+
+        :param input_filename: Path of the input file, or glob of files
+        :param columns: Columns to read, see project_rows. All by default.
+        :param sheets: Sheets to read, see get_sheet_indexes. The first one by default.
+
+        :return: Iterator of the rows of the file.
+        :rtype: Iterator
+        """
+        parts = []
+        for filename in self.get_input_filenames(input_filename):
+            if sheets is None or 'csv' == self.detect_input_format(filename):
+                parts.append((filename, 0))
+            else:
+                parts.extend((filename, sheet_index) for sheet_index in self.get_sheet_indexes(filename, sheets))
+        if len(parts) == 1:
+            rows = self.iter_input_part(parts[0][0], columns, parts[0][1])
+        else:
+            rows = self.iter_input_parts(parts, columns)
+
+        first_rows = list(itertools.islice(rows, 2))
+        if first_rows == [] or first_rows == [[None]] or first_rows == [(None,)]:
+            raise Exception('Error: no data')
+        return itertools.chain(first_rows, rows)
+
+    def iter_input_part(self, input_filename, columns = None, sheet_index = 0):
+        """Read the rows of a sheet of a file, from the cache if a cache directory is set
+
+        :param input_filename: Path of the input file
+        :param columns: Columns to read, see project_rows. All by default.
+        :param sheet_index: Index of the sheet, the first one by default
+
+        :return: Iterator of the rows of the sheet.
+        :rtype: Iterator
+        """
+        if self.cache_dir is not None:
+            rows = iter(self.read_input_data_with_cache(input_filename, sheet_index))
+            if columns is not None:
+                rows = self.project_rows(rows, columns)
+            return rows
+        return self.iter_input_data_from_file(input_filename, columns, sheet_index)
+
+    def iter_input_parts(self, parts, columns = None):
+        """Read several parts of an input in parallel threads, as one table
+
+        Each part is read in advance by a thread up to a number of chunks of
+        rows, and the rows are returned in the order of the parts.
+
+        :param parts: Array of tuples (path of the file, index of the sheet)
+        :param columns: Columns to read, see project_rows. All by default.
+
+        :return: Generator of the rows, with the header of the first part only
+        :rtype: Generator
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(self.READ_QUEUE_CHUNKS) for part in parts]
+
+        def put(part_queue, item):
+            while not stop.is_set():
+                try:
+                    part_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read_part(part, part_queue):
+            try:
+                rows = self.iter_input_part(part[0], columns, part[1])
+                while True:
+                    chunk = list(itertools.islice(rows, self.SPILL_CHUNK_SIZE))
+                    if not chunk or not put(part_queue, chunk):
+                        break
+                put(part_queue, None)
+            except Exception as e:
+                put(part_queue, e)
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(self.READ_THREADS, len(parts)))
+        try:
+            for part, part_queue in zip(parts, queues):
+                executor.submit(read_part, part, part_queue)
+            header = None
+            for part_index, (part, part_queue) in enumerate(zip(parts, queues)):
+                skip_header = part_index > 0
+                while True:
+                    chunk = part_queue.get()
+                    if chunk is None:
+                        break
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    if header is None:
+                        header = chunk[0]
+                    elif skip_header:
+                        # Rows of a part with other columns would be merged in the wrong columns
+                        if not self.ignore_header and chunk[0] != header:
+                            raise Exception('Error: header of part ' + str(part_index + 1) + ' of the input (' + part[0] +
+                                            ') differs from the header of the first part')
+                        chunk = chunk[1:]
+                    skip_header = False
+                    yield from chunk
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+
+    def get_input_filenames(self, input_filename):
+        """Get the files of an input, the files of a glob in name order
+
+        :param input_filename: Path of the input file, or glob of files
+
+        :return: Paths of the files
+        :rtype: Array
+        """
+        if glob.has_magic(input_filename):
+            input_filenames = sorted(glob.glob(input_filename))
+        else:
+            input_filenames = [input_filename] if os.path.exists(input_filename) else []
+        if not input_filenames:
+            raise Exception('Error: Input file not found.')
+        return input_filenames
+
+    def input_exists(self, input_filename):
+        """Test if an input file exists, or a file of a glob
+
+        :param input_filename: Path of the input file, or glob of files
+
+        :return: True if the input exists
+        :rtype: Boolean
+        """
+        if glob.has_magic(input_filename):
+            return len(glob.glob(input_filename)) > 0
+        return os.path.exists(input_filename)
+
+    def get_input_size(self, input_filename):
+        """Get the size of an input file, or the total size of the files of a glob
+
+        :param input_filename: Path of the input file, or glob of files
+
+        :return: Size in bytes
+        :rtype: Integer
+        """
+        return sum(os.path.getsize(filename) for filename in self.get_input_filenames(input_filename))
+
+    def get_sheet_indexes(self, input_filename, sheets):
+        """Get the indexes of the selected sheets of a spreadsheet file
+
+        :param input_filename: Path of the input file
+        :param sheets: Numbers of the sheets (start at 1) or patterns of
+                       their names, separated by commas
+
+        :return: Indexes of the sheets (start at 0)
+        :rtype: Array
+        """
+        if 'xlsx' == self.detect_input_format(input_filename):
+            import openpyxl
+            with open(input_filename, 'rb') as input_file:
+                workbook = openpyxl.load_workbook(input_file, read_only=True)
+                sheet_names = workbook.sheetnames
+                workbook.close()
+        else:
+            import xlrd
+            workbook = xlrd.open_workbook(input_filename, on_demand = True)
+            sheet_names = workbook.sheet_names()
+            workbook.release_resources()
+        indexes = []
+        for sheet in sheets.split(','):
+            if sheet.isdigit():
+                selected = [int(sheet) - 1] if 0 < int(sheet) <= len(sheet_names) else []
+            else:
+                selected = [sheet_index for sheet_index, name in enumerate(sheet_names) if fnmatch.fnmatchcase(name, sheet)]
+            indexes.extend(sheet_index for sheet_index in selected if sheet_index not in indexes)
+        if not indexes:
+            raise Exception('Error: no sheet ' + sheets + ' in ' + input_filename)
+        return indexes
+
+    def iter_input_data_from_file(self, input_filename, columns = None, sheet_index = 0):
+        """Read input data of a file with the reader of its format
+
+        The format is detected from the content of the file.
+
+        :param input_filename: Path of the input file
+        :param columns: Columns to read, see project_rows. All by default.
+        :param sheet_index: Index of the sheet of spreadsheets, the first one by default
+
+        :return: Iterator of the rows of the file.
+        :rtype: Iterator
+        """
+        if not os.path.exists(input_filename):
+            raise Exception('Error: Input file not found.')
+
+        input_format = self.detect_input_format(input_filename)
+        if 'xlsx' == input_format:
+            return self.iter_input_data_from_xlsx(input_filename, columns, sheet_index)
+        elif 'xls' == input_format:
+            return self.iter_input_data_from_xls(input_filename, columns, sheet_index = sheet_index)
+        return self.iter_input_data_from_csv(input_filename, columns)
+
+    def get_cache_filename(self, input_filename, sheet_index = 0):
+        """Get the path of the cache file of an input file
+
+        The name is a hash of the path, the size, the modification time and
+        the content of the input file, and of the index of the sheet. For
+        CSV files, the delimiter, the encoding and the quoting used to parse
+        the file are added. A missing delimiter is found from the content.
+
+        :param input_filename: Path of the input file
+        :param sheet_index: Index of the sheet
+
+        :return: Path of the cache file
+        :rtype: String
+        """
+        file_stat = os.stat(input_filename)
+        content_hash = hashlib.sha256()
+        with open(input_filename, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+                content_hash.update(chunk)
+        fingerprint = hashlib.sha256()
+        for value in [os.path.abspath(input_filename), file_stat.st_size, file_stat.st_mtime_ns, content_hash.hexdigest()]:
+            fingerprint.update(str(value).encode('utf-8') + b'\0')
+        if sheet_index:
+            fingerprint.update(str(sheet_index).encode('utf-8') + b'\0')
+        if 'csv' == self.detect_input_format(input_filename):
+            for value in [self.csv_delimiter, self.csv_encoding.lower(), self.csv_quoting]:
+                fingerprint.update(repr(value).encode('utf-8') + b'\0')
+        return os.path.join(self.cache_dir, fingerprint.hexdigest() + '.cache')
+
+    def read_input_data_with_cache(self, input_filename, sheet_index = 0):
+        """Read input data from the cache, parse and cache the file if missing
+
+        Rows are stored by column in the cache file.
+
+        :param input_filename: Path of the input file
+        :param sheet_index: Index of the sheet of spreadsheets
+
+        :return: Array with the data of the file.
+        :rtype: Array
+        """
+        if not os.path.exists(input_filename):
+            raise Exception('Error: Input file not found.')
+
+        cache_filename = self.get_cache_filename(input_filename, sheet_index)
+        try:
+            with open(cache_filename, 'rb') as cache_file:
+                cached_data = pickle.load(cache_file)
+            if cached_data['version'] == self.CACHE_VERSION:
+                # Mark the file as recently used
+                os.utime(cache_filename)
+                rows = [list(row) for row in zip(*cached_data['columns'])]
+                for row, length in zip(rows, cached_data['lengths'] or ()):
+                    del row[length:]
+                return rows
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            pass
+
+        rows = list(self.iter_input_data_from_file(input_filename, sheet_index = sheet_index))
+        lengths = [len(row) for row in rows]
+        width = max(lengths, default=0)
+        columns = [[] for col_index in range(width)]
+        for row in rows:
+            for col_index, column in enumerate(columns):
+                column.append(row[col_index] if col_index < len(row) else None)
+        cached_data = {
+            'version': self.CACHE_VERSION,
+            'columns': columns,
+            'lengths': None if min(lengths, default=0) == width else lengths
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as cache_file:
+            pickle.dump(cached_data, cache_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file.name, cache_filename)
+        self.evict_cache()
+        return rows
+
+    def evict_cache(self):
+        """Remove the least recently used cache files above the cache size
+        """
+        cache_files = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith('.cache'):
+                file_stat = os.stat(os.path.join(self.cache_dir, filename))
+                cache_files.append((file_stat.st_mtime, file_stat.st_size, filename))
+        total_size = sum(file_size for mtime, file_size, filename in cache_files)
+        for mtime, file_size, filename in sorted(cache_files):
+            if total_size <= self.cache_size * 1024 * 1024:
+                break
+            os.remove(os.path.join(self.cache_dir, filename))
+            total_size -= file_size
+
+    def clear_cache(self):
+        """Remove all the files of the cache
+        """
+        if self.cache_dir is not None and os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith('.cache'):
+                    os.remove(os.path.join(self.cache_dir, filename))
+
+    def write_index(self, input_filename, index_filename):
+        """Write the index of an input file on the match column of the second input
+
+        :param input_filename: Path of the input file
+        :param index_filename: Path of the index file
+        """
+        rows = self.iter_input_data(input_filename, self.get_input_columns(2), self.sheets_2)
+        if 'all' != self.duplicates_2:
+            rows = self.iter_unique_rows(rows, 2)
+        rows = iter(rows)
+        header = next(rows)
+        index = self.build_index(rows, self.get_key_function(2))
+        offsets = {}
+        with open(index_filename, 'wb') as index_file:
+            index_file.write(self.INDEX_MAGIC)
+            for key, rows_with_key in index.items():
+                start = index_file.tell()
+                pickle.dump(rows_with_key, index_file, pickle.HIGHEST_PROTOCOL)
+                offsets[key] = (start, index_file.tell())
+            footer_offset = index_file.tell()
+            footer = {'header': header, 'match_column': self.match_column_2, 'columns': self.columns_2,
+                      'normalizations': self.normalizations, 'offsets': offsets}
+            pickle.dump(footer, index_file, pickle.HIGHEST_PROTOCOL)
+            index_file.write(footer_offset.to_bytes(8, 'little'))
+
+    def start_batch(self, index_filename, input_filenames):
+        """Match several input files with an index file
+
+        Each output file is written in the output directory with the name of
+        its input file.
+
+        :param index_filename: Path of the index file
+        :param input_filenames: Paths or patterns of the input files
+        """
+        filenames = []
+        for input_filename in input_filenames:
+            filenames.extend(sorted(glob.glob(input_filename)) if glob.has_magic(input_filename) else [input_filename])
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.match_index = MatchIndex(index_filename)
+        try:
+            self.match_column_2 = self.match_index.match_column
+            self.columns_2 = self.match_index.columns
+            self.normalizations = self.match_index.normalizations
+            for input_filename in filenames:
+                output_filename = os.path.join(self.out_dir, os.path.basename(input_filename))
+                if os.path.abspath(output_filename) == os.path.abspath(input_filename):
+                    raise Exception('Error: output file overwrites input file')
+                self.start(input_filename, None, output_filename)
+        finally:
+            self.match_index.close()
+            self.match_index = None
+
+    def start(self, input1_filename, input2_filename, output_filename):
+        if self.state_filename is not None:
+            return self.start_delta(input1_filename, input2_filename, output_filename)
+        self.match_files(input1_filename, input2_filename, output_filename)
+        if self.stats is not None:
+            self.write_stats()
+
+    def match_files(self, input1_filename, input2_filename, output_filename):
+        """Match input files and write the output file
+
+        :param input1_filename: Path of the first input file
+        :param input2_filename: Path of the second input file, None with an index file
+        :param output_filename: Path of the output file
+        """
+        self.input_data_1 = []
+        self.input_data_2 = []
+
+        # Test if input files exists
+        if not self.input_exists(input1_filename) or \
+                (self.match_index is None and not self.input_exists(input2_filename)):
+            raise Exception('Error: input file missing')
+
+        self.stats = None
+        if self.show_stats and self.print_stats not in self.listeners:
+            self.listeners.append(self.print_stats)
+        if self.listeners or self.stats_filename is not None:
+            self.stats = MatchStats()
+
+        if self.workers > 1:
+            if self.can_match_partitioned(input1_filename, input2_filename, output_filename):
+                # Worker processes read the inputs and write the merged rows themselves
+                self.match_files_partitioned(input1_filename, input2_filename, output_filename)
+                return
+            if self.rows_per_shard is None or ('files' != self.shard_mode and '.xls' in output_filename):
+                raise Exception('Error: --workers needs CSV input files, a CSV or TSV output and the hash engine with an '
+                                'exact inner join without --match-index or extra inputs, or --rows-per-shard')
+
+        # Start process, rows are written as soon as they are merged
+        self.read_inputs(input1_filename, input2_filename)
+        other_sheets = []
+        if self.extra_inputs:
+            output_data = self.iter_match_multi(self.read_extra_inputs())
+        elif 'inner' != self.join_mode:
+            output_data, other_sheets = self.iter_match_join()
+        else:
+            output_data = self.iter_match()
+        self.start_phase('write')
+        if self.stats is not None:
+            output_data = self.iter_with_stats(output_data, 'match', 'output_rows')
+        self.write_output_data(output_filename, output_data, other_sheets)
+        self.start_phase(None)
+
+    def read_inputs(self, input1_filename, input2_filename):
+        """Read the 2 first inputs in input_data_1 and input_data_2
+
+        :param input1_filename: Path of the first input file
+        :param input2_filename: Path of the second input file, None with an index file
+        """
+        # Keep the smallest file in memory for the index, the other one is
+        # read as a stream while matching. Sort-merge streams both files.
+        self.start_phase('read_1')
+        input_data_1 = self.iter_input_data(input1_filename, self.get_input_columns(1), self.sheets_1)
+        if self.stats is not None:
+            input_data_1 = self.iter_with_stats(input_data_1, 'read_1', 'rows_read_1')
+        if self.match_index is not None:
+            # The second input is already indexed
+            input_data_2 = []
+        else:
+            self.start_phase('read_2')
+            input_data_2 = self.iter_input_data(input2_filename, self.get_input_columns(2), self.sheets_2)
+            if self.stats is not None:
+                input_data_2 = self.iter_with_stats(input_data_2, 'read_2', 'rows_read_2')
+            index_first_input = self.get_input_size(input1_filename) < self.get_input_size(input2_filename)
+            if self.groups_duplicates(1) != self.groups_duplicates(2):
+                # Keep in memory the input whose rows are grouped by key
+                index_first_input = self.groups_duplicates(1)
+            if self.match_engine == 'hash' and index_first_input:
+                self.start_phase('read_1')
+                input_data_1 = list(input_data_1)
+            elif self.match_engine != 'sort-merge':
+                input_data_2 = list(input_data_2)
+        if self.prefilter is not None and self.match_engine == 'sort-merge' and self.match_index is None:
+            # Discard the rows of the biggest input without key in the smallest
+            # one before they are sorted, the keys are read in a first pass
+            if self.get_input_size(input1_filename) < self.get_input_size(input2_filename):
+                self.start_phase('read_1')
+                keys = self.build_prefilter(self.iter_input_data(input1_filename, self.get_input_columns(1), self.sheets_1), 1)
+                input_data_2 = self.filter_rows(input_data_2, keys, 2)
+            else:
+                self.start_phase('read_2')
+                keys = self.build_prefilter(self.iter_input_data(input2_filename, self.get_input_columns(2), self.sheets_2), 2)
+                input_data_1 = self.filter_rows(input_data_1, keys, 1)
+        self.input_data_1 = input_data_1
+        self.input_data_2 = input_data_2
+
+    def read_extra_inputs(self):
+        """Read all the inputs for a match of more than 2 inputs
+
+        Must be called after the read of the 2 first inputs in start. The
+        policies for duplicated keys are applied to the 2 first inputs.
+
+        :return: Inputs for iter_match_multi
+        :rtype: Array
+        """
+        if self.match_engine != 'hash' or self.match_index is not None:
+            raise Exception('Error: match of more than 2 inputs needs the hash engine without index file')
+        self.apply_duplicates_policies()
+        inputs = [(self.input_data_1, self.get_match_index(1)), (self.input_data_2, self.get_match_index(2))]
+        for input_number, (input_filename, match_column) in enumerate(self.extra_inputs, 3):
+            if not self.input_exists(input_filename):
+                raise Exception('Error: input file missing')
+            self.start_phase('read_' + str(input_number))
+            rows = self.iter_input_data(input_filename)
+            if self.stats is not None:
+                rows = self.iter_with_stats(rows, 'read_' + str(input_number), 'rows_read_' + str(input_number))
+            inputs.append((list(rows), self.get_match_index(input_number)))
+        return inputs
+
+    def start_delta(self, input1_filename, input2_filename, output_filename):
+        """Match input files by updating the output of the previous run
+
+        The state file keeps the fingerprint and the key of each row of the
+        inputs, and the size in the output file of the merged rows of each
+        row of the first input. The records of the CSV files are compared
+        without being parsed, only the new rows and the rows to match again
+        are parsed. The merged rows of a row of the first input are copied
+        from the previous output when the row and the rows of the second
+        input with its key are not modified, otherwise the row is matched
+        again. Nothing is read if the input files, the output file and the
+        options are not modified since the previous run.
+
+        :param input1_filename: Path of the first input file, a CSV file
+        :param input2_filename: Path of the second input file, a CSV file
+        :param output_filename: Path of the output file, a CSV or TSV file
+
+        :return: Number of inserted, changed and deleted rows of each input
+        :rtype: Dict
+        """
+        if self.match_index is not None or self.extra_inputs:
+            raise Exception('Error: delta mode needs 2 input files')
+        if not self.input_exists(input1_filename) or not self.input_exists(input2_filename):
+            raise Exception('Error: input file missing')
+        if not self.is_csv_file(input1_filename) or not self.is_csv_file(input2_filename) or \
+                ('.csv' not in output_filename and '.tsv' not in output_filename) or self.rows_per_shard is not None:
+            raise Exception('Error: delta mode needs CSV input files and a CSV or TSV output file without shards')
+        if self.match_engine != 'hash' or self.fuzzy_threshold is not None or 'inner' != self.join_mode or 'all' != self.duplicates_1:
+            raise Exception('Error: delta mode needs the hash engine on exact keys, the inner join and all the rows of the first input')
+        if self.workers > 1:
+            raise Exception('Error: delta mode does not use --workers')
+
+        # Settings which change the keys of the rows, and options which change the merged rows
+        settings = [self.get_match_index(1), self.get_match_index(2), self.get_input_columns(1), self.get_input_columns(2),
+                    self.normalizations, self.csv_delimiter, self.csv_encoding, self.csv_quoting]
+        options = [self.duplicates_2, self.ignore_header]
+        files = []
+        for filename in [input1_filename, input2_filename, output_filename]:
+            file_stat = os.stat(filename) if os.path.exists(filename) else None
+            files.append(None if file_stat is None else (filename, file_stat.st_size, file_stat.st_mtime_ns))
+        changes = {}
+        for input_number in [1, 2]:
+            for change in ['inserted', 'changed', 'deleted']:
+                changes[change + '_rows_' + str(input_number)] = 0
+        self.stats = None
+        if self.show_stats and self.print_stats not in self.listeners:
+            self.listeners.append(self.print_stats)
+        if self.listeners or self.stats_filename is not None:
+            self.stats = MatchStats()
+        state = self.read_state()
+        if state is not None and state['settings'] == settings and state['options'] == options and state['files'] == files:
+            # Nothing changed since the previous run
+            if self.stats is not None:
+                self.update_stats(**changes)
+                self.write_stats()
+            return changes
+        previous = {}
+        if state is not None and state['settings'] == settings:
+            state = self.read_state(True)
+            if state is not None and state['settings'] == settings:
+                previous = state
+
+        # Keys of the second input whose rows are modified
+        self.start_phase('read_2')
+        records_2 = parsed_rows_2 = None
+        if previous and previous['files'][1] == files[1]:
+            header_2, fingerprints_2, keys_2 = previous['header_2'], previous['fingerprints_2'], previous['keys_2']
+            same_header_2 = True
+            changed_keys = set()
+        else:
+            header_2, records_2 = self.read_csv_records(input2_filename)
+            fingerprints_2 = get_record_fingerprints(records_2)
+            same_header_2 = previous and previous['header_2'] == header_2
+            previous_keys = dict(zip(previous['fingerprints_2'], previous['keys_2'])) if same_header_2 else {}
+            keys_2, parsed_rows_2 = self.get_record_keys(header_2, records_2, fingerprints_2, previous_keys, 2)
+            added_rows, removed_rows, same_order = get_row_differences(previous.get('fingerprints_2', []),
+                                                                       previous.get('keys_2', []), fingerprints_2, keys_2)
+            changes.update(count_row_changes(added_rows, removed_rows, 2))
+            # Keys with added or removed rows, and keys whose rows may be in another order
+            changed_keys = added_rows.keys() | removed_rows.keys()
+            if not same_order:
+                changed_keys.update(key for key, count in collections.Counter(keys_2).items() if count > 1)
+
+        # Rows of the first input to match again: new rows, and rows with a modified key
+        self.start_phase('read_1')
+        records_1 = None
+        if previous and previous['files'][0] == files[0]:
+            header_1, fingerprints_1, keys_1 = previous['header_1'], previous['fingerprints_1'], previous['keys_1']
+            parsed_rows_1 = [None] * len(fingerprints_1)
+            same_header_1 = True
+            # Each row is the row of the previous run with the same index
+            previous_rows = None
+        else:
+            header_1, records_1 = self.read_csv_records(input1_filename)
+            fingerprints_1 = get_record_fingerprints(records_1)
+            same_header_1 = previous and previous['header_1'] == header_1
+            previous_keys = dict(zip(previous['fingerprints_1'], previous['keys_1'])) if same_header_1 else {}
+            keys_1, parsed_rows_1 = self.get_record_keys(header_1, records_1, fingerprints_1, previous_keys, 1)
+            added_rows, removed_rows, same_order = get_row_differences(previous.get('fingerprints_1', []),
+                                                                       previous.get('keys_1', []), fingerprints_1, keys_1)
+            changes.update(count_row_changes(added_rows, removed_rows, 1))
+            previous_rows = []
+            if same_header_1:
+                previous_indexes = dict(zip(previous['fingerprints_1'], range(len(previous['fingerprints_1']))))
+                previous_rows = list(map(previous_indexes.get, fingerprints_1))
+        rows_count = len(fingerprints_1)
+        # Merged rows of the previous output, unless a header, an option or the output file is modified
+        copy_output = same_header_1 and same_header_2 and previous['options'] == options and previous['files'][2] == files[2]
+        if not copy_output:
+            rematched = list(range(rows_count))
+        elif previous_rows is None:
+            rematched = [row_index for row_index, key in enumerate(keys_1) if key in changed_keys] if changed_keys else []
+        else:
+            rematched = [row_index for row_index, (previous_row, key) in enumerate(zip(previous_rows, keys_1))
+                         if previous_row is None or key in changed_keys]
+        if records_1 is None and rematched:
+            header_1, records_1 = self.read_csv_records(input1_filename)
+        self.parse_missing_records(header_1, records_1, parsed_rows_1, rematched, 1)
+
+        # Index of the rows of the second input with the keys to match again
+        self.start_phase('read_2')
+        needed_keys = {keys_1[row_index] for row_index in rematched}
+        index = {}
+        if needed_keys:
+            if records_2 is None:
+                header_2, records_2 = self.read_csv_records(input2_filename)
+                parsed_rows_2 = [None] * len(records_2)
+            row_indexes = [row_index for row_index, key in enumerate(keys_2) if key in needed_keys]
+            self.parse_missing_records(header_2, records_2, parsed_rows_2, row_indexes, 2)
+            rows_2 = [self.parse_csv_records(header_2, [], 2)[0]] + [parsed_rows_2[row_index] for row_index in row_indexes]
+            if 'all' != self.duplicates_2:
+                rows_2 = self.iter_unique_rows(rows_2, 2)
+            rows_2 = iter(rows_2)
+            next(rows_2)
+            index = self.build_index(rows_2, self.get_key_function(2))
+
+        # Copy the merged rows of the previous output, or match the rows again
+        self.start_phase('match')
+        delimiter = self.csv_delimiter or ('\t' if '.tsv' in output_filename else ',')
+        output_text = io.StringIO(newline='')
+        writer = csv.writer(output_text, delimiter=delimiter, quoting=self.CSV_QUOTING[self.csv_quoting])
+        writer.writerows(self.match_header(self.parse_csv_records(header_1, [], 1)[0], self.parse_csv_records(header_2, [], 2)[0]))
+        output_header = output_text.getvalue().encode(self.csv_encoding)
+        output_text.seek(0)
+        output_text.truncate()
+        if not copy_output:
+            lengths_1 = [0] * rows_count
+            output_rows_1 = [0] * rows_count
+        elif previous_rows is None:
+            lengths_1 = list(previous['lengths_1'])
+            output_rows_1 = list(previous['output_rows_1'])
+        else:
+            lengths_1 = [0 if previous_row is None else previous['lengths_1'][previous_row] for previous_row in previous_rows]
+            output_rows_1 = [0 if previous_row is None else previous['output_rows_1'][previous_row] for previous_row in previous_rows]
+        positions = list(itertools.accumulate(itertools.chain([len(output_header)], previous['lengths_1']))) if copy_output else []
+        match_column_1 = self.get_match_index(1)
+        match_column_2 = self.get_match_index(2)
+        # The previous output is read while the new one is written next to it
+        temporary_filename = output_filename + '.' + str(os.getpid()) + '.tmp'
+        output_file = open(temporary_filename, 'xb')
+        try:
+            with contextlib.ExitStack() as stack:
+                stack.enter_context(output_file)
+                previous_data = b''
+                if copy_output and files[2][1] > 0:
+                    previous_file = stack.enter_context(open(output_filename, 'rb'))
+                    previous_data = stack.enter_context(mmap.mmap(previous_file.fileno(), 0, access=mmap.ACCESS_READ))
+                output_file.write(output_header)
+                # Rows matched again whose merged rows are in output_text, with the end of their text
+                text_ends = []
+
+                def write_text():
+                    text = output_text.getvalue()
+                    data = text.encode(self.csv_encoding)
+                    output_file.write(data)
+                    text_start = 0
+                    for row_index, text_end in text_ends:
+                        if len(data) == len(text):
+                            lengths_1[row_index] = text_end - text_start
+                        else:
+                            lengths_1[row_index] = len(text[text_start:text_end].encode(self.csv_encoding))
+                        text_start = text_end
+                    output_text.seek(0)
+                    output_text.truncate()
+                    text_ends.clear()
+
+                row_start = 0
+                for row_index in itertools.chain(rematched, [rows_count]):
+                    if row_start < row_index:
+                        # Rows between the rows matched again, in consecutive rows of the previous output
+                        if text_ends:
+                            write_text()
+                        if previous_rows is None:
+                            output_file.write(previous_data[positions[row_start]:positions[row_index]])
+                        else:
+                            copy_start = copy_end = previous_rows[row_start]
+                            for previous_row in previous_rows[row_start:row_index]:
+                                if previous_row != copy_end:
+                                    output_file.write(previous_data[positions[copy_start]:positions[copy_end]])
+                                    copy_start = previous_row
+                                copy_end = previous_row + 1
+                            output_file.write(previous_data[positions[copy_start]:positions[copy_end]])
+                    if row_index < rows_count:
+                        input_1 = parsed_rows_1[row_index]
+                        rows_matched = index.get(keys_1[row_index], ())
+                        for input_2 in rows_matched:
+                            writer.writerow(self.merge_rows(input_1, input_2, match_column_1, match_column_2))
+                        output_rows_1[row_index] = len(rows_matched)
+                        text_ends.append((row_index, output_text.tell()))
+                    row_start = row_index + 1
+                if text_ends:
+                    write_text()
+        except BaseException:
+            os.remove(temporary_filename)
+            raise
+        os.replace(temporary_filename, output_filename)
+        self.start_phase(None)
+        matched = rows_count - output_rows_1.count(0)
+        self.update_stats(rows_read_1 = 0 if records_1 is None else rows_count + 1,
+                          rows_read_2 = 0 if records_2 is None else len(records_2) + 1,
+                          matched_rows = matched, unmatched_rows = rows_count - matched,
+                          output_rows = sum(output_rows_1) + (0 if self.ignore_header else 1),
+                          rematched_rows = len(rematched), copied_rows = rows_count - len(rematched))
+
+        output_stat = os.stat(output_filename)
+        files[2] = (output_filename, output_stat.st_size, output_stat.st_mtime_ns)
+        self.write_state({
+            'settings': settings,
+            'options': options,
+            'files': files
+        }, {
+            'header_1': header_1,
+            'fingerprints_1': fingerprints_1,
+            'keys_1': keys_1,
+            'lengths_1': lengths_1,
+            'output_rows_1': output_rows_1,
+            'header_2': header_2,
+            'fingerprints_2': fingerprints_2,
+            'keys_2': keys_2
+        })
+        self.update_stats(**changes)
+        if self.stats is not None:
+            self.write_stats()
+        return changes
+
+    def is_csv_file(self, input_filename):
+        """Test if an input is one CSV file whose rows can be split without being parsed
+
+        :param input_filename: Path of the input file
+
+        :return: True for a CSV file whose encoding keeps the bytes of line breaks and quotes
+        :rtype: Boolean
+        """
+        if glob.has_magic(input_filename) or 'csv' != self.detect_input_format(input_filename):
+            return False
+        try:
+            return '\n"'.encode(self.csv_encoding) == b'\n"'
+        except LookupError:
+            return False
+
+    def read_csv_records(self, input_filename):
+        """Read the records of a CSV file without parsing them
+
+        A record is a line, with the next lines while it has an odd number
+        of quotes, as in split_csv_file.
+
+        :param input_filename: Path of the CSV file
+
+        :return: Header record, and array of the other records, in bytes without the line breaks
+        :rtype: Tuple
+        """
+        with open(input_filename, 'rb') as input_file:
+            data = input_file.read()
+        if not data:
+            raise Exception('Error: no data')
+        lines = data.split(b'\n')
+        if not lines[-1]:
+            lines.pop()
+        if 'none' == self.csv_quoting or b'"' not in data:
+            return lines[0], lines[1:]
+        records = []
+        record = None
+        for line in lines:
+            if record is not None:
+                record += b'\n' + line
+                if record.count(b'"') % 2 == 0:
+                    records.append(record)
+                    record = None
+            elif line.count(b'"') % 2:
+                record = line
+            else:
+                records.append(line)
+        if record is not None:
+            records.append(record)
+        return records[0], records[1:]
+
+    def parse_csv_records(self, header, records, input_number):
+        """Parse records read by read_csv_records
+
+        :param header: Header record of the file
+        :param records: Records to parse
+        :param input_number: Number of the input, for its columns
+
+        :return: Header and rows, with the columns of the input
+        :rtype: Array
+        """
+        encoding = 'utf-8-sig' if self.csv_encoding.lower() in ['utf-8', 'utf8'] else self.csv_encoding
+        header_text = header.decode(encoding)
+        delimiter = self.csv_delimiter
+        if delimiter is None:
+            delimiter = '\t' if '\t' in header_text.split('\n', 1)[0] else ','
+        # Each record is parsed as a line of the text, a blank line is an empty row
+        text = header_text + '\n' + b'\n'.join(records).decode(self.csv_encoding) if records else header_text
+        rows = csv.reader(io.StringIO(text, newline=''), delimiter=delimiter, quoting=self.CSV_QUOTING[self.csv_quoting])
+        columns = self.get_input_columns(input_number)
+        if columns is not None:
+            rows = self.project_rows(rows, columns)
+        return list(rows)
+
+    def get_record_keys(self, header, records, fingerprints, previous_keys, input_number):
+        """Get the keys of the records of an input, parsing only the new records
+
+        :param header: Header record of the input
+        :param records: Records of the input
+        :param fingerprints: Fingerprints of the records
+        :param previous_keys: Keys of the fingerprints of the previous run
+        :param input_number: Number of the input
+
+        :return: Array of the keys of the records, and array of the parsed rows, None if not parsed
+        :rtype: Tuple
+        """
+        key_function = self.get_key_function(input_number)
+        if not previous_keys:
+            rows = self.parse_csv_records(header, records, input_number)[1:]
+            return list(map(key_function, rows)), rows
+        keys = list(map(previous_keys.get, fingerprints))
+        rows = [None] * len(records)
+        missing = [row_index for row_index, fingerprint in enumerate(fingerprints) if fingerprint not in previous_keys]
+        self.parse_missing_records(header, records, rows, missing, input_number)
+        for row_index in missing:
+            keys[row_index] = key_function(rows[row_index])
+        return keys, rows
+
+    def parse_missing_records(self, header, records, rows, row_indexes, input_number):
+        """Parse the records which are not parsed yet among some records of an input
+
+        :param header: Header record of the input
+        :param records: Records of the input
+        :param rows: Array of the parsed rows of the records, None if not parsed, updated
+        :param row_indexes: Indexes of the records to parse
+        :param input_number: Number of the input
+        """
+        missing = [row_index for row_index in row_indexes if rows[row_index] is None]
+        if missing:
+            for row_index, row in zip(missing, self.parse_csv_records(header, [records[row_index] for row_index in missing], input_number)[1:]):
+                rows[row_index] = row
+
+    def read_state(self, with_rows = False):
+        """Read the state file of the previous run of the delta mode
+
+        The fingerprints, the keys and the merged rows of the rows of the
+        inputs are stored after the other values of the state, and are read
+        only when needed.
+
+        :param with_rows: Read the values of the rows of the inputs too
+
+        :return: State of the previous run, None if missing or not readable
+        :rtype: Dict
+        """
+        try:
+            with open(self.state_filename, 'rb') as state_file:
+                state = pickle.load(state_file)
+                if state['version'] != self.STATE_VERSION:
+                    return None
+                if with_rows:
+                    state.update(pickle.load(state_file))
+            return state
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError):
+            pass
+        return None
+
+    def write_state(self, state, rows):
+        """Write the state file of the delta mode
+
+        :param state: State of the run
+        :param rows: Values of the rows of the inputs
+        """
+        state['version'] = self.STATE_VERSION
+        state_directory = os.path.dirname(os.path.abspath(self.state_filename))
+        with tempfile.NamedTemporaryFile(dir=state_directory, delete=False) as state_file:
+            pickle.dump(state, state_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(rows, state_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(state_file.name, self.state_filename)
+
+    def start_phase(self, phase):
+        """Start a phase of the process, if statistics are enabled
+
+        :param phase: Name of the phase, None at the end of the process
+        """
+        if self.stats is not None:
+            self.stats.switch_phase(phase)
+            self.emit('phase', phase)
+
+    def write_stats(self):
+        """Send the statistics to the listeners and write them in the statistics file
+        """
+        stats = self.stats.get_stats()
+        self.emit('stats', stats)
+        if self.stats_filename is not None:
+            with open(self.stats_filename, 'w') as stats_file:
+                json.dump(stats, stats_file, indent=2)
+
+    def write_output_data(self, output_filename, output_data, other_sheets = ()):
+        """Write output data with the writer of the extension of the output file
+
+        Rows are split in several sheets or files above the number of rows
+        per shard, and above the maximum number of rows of xls sheets.
+        Files of the shards are written in parallel processes.
+
+        :param output_filename: Path of the output file
+        :param output_data: Data to write, array or iterable of rows.
+        :param other_sheets: Array of tuples (name, rows) written after the
+                             output data, in other sheets of spreadsheets or
+                             in files output_NAME otherwise
+        """
+        rows_per_shard = self.rows_per_shard
+        if '.xlsx' not in output_filename and '.xls' in output_filename:
+            max_rows = self.XLS_MAX_ROWS if self.ignore_header else self.XLS_MAX_ROWS - 1
+            rows_per_shard = max_rows if rows_per_shard is None else min(rows_per_shard, max_rows)
+        if other_sheets and ('files' == self.shard_mode or '.xls' not in output_filename):
+            self.write_output_data(output_filename, output_data)
+            output_base, output_extension = os.path.splitext(output_filename)
+            for sheetname, sheet_data in other_sheets:
+                self.write_output_data(output_base + '_' + sheetname + output_extension, sheet_data)
+        elif rows_per_shard is not None and ('files' == self.shard_mode or '.xls' not in output_filename):
+            self.write_output_shards(output_filename, output_data, rows_per_shard)
+        elif '.xlsx' in output_filename:
+            self.write_output_data_to_xlsx(output_filename, output_data, self.output_sheetname, rows_per_shard, other_sheets)
+        elif '.xls' in output_filename:
+            self.write_output_data_to_xls(output_filename, output_data, self.output_sheetname, rows_per_shard, other_sheets)
+        elif '.tsv' in output_filename:
+            self.write_output_data_to_csv(output_filename, output_data, self.csv_delimiter or '\t')
+        elif '.csv' in output_filename:
+            self.write_output_data_to_csv(output_filename, output_data, self.csv_delimiter or ',')
+
+    def write_output_shards(self, output_filename, output_data, rows_per_shard):
+        """Write output data in several files, the header is repeated in each file
+
+        Files are named with the number of the shard after the name of the
+        output file, output_1.xlsx, output_2.xlsx... The output file is
+        written alone if all the rows fit in one shard.
+
+        :param output_filename: Path of the output file
+        :param output_data: Data to write, array or iterable of rows.
+        :param rows_per_shard: Maximum number of rows in a file, without the header
+        """
+        rows = iter(output_data)
+        header = []
+        if not self.ignore_header:
+            header = [next(rows, None)]
+            if header[0] is None:
+                header = []
+        shard = list(itertools.islice(rows, rows_per_shard))
+        next_shard = list(itertools.islice(rows, rows_per_shard))
+        settings = {
+            'output_sheetname': self.output_sheetname,
+            'ignore_header': self.ignore_header,
+            'csv_delimiter': self.csv_delimiter,
+            'csv_encoding': self.csv_encoding,
+            'csv_quoting': self.csv_quoting
+        }
+        if not next_shard:
+            write_output_shard(settings, output_filename, header + shard)
+            return
+        output_base, output_extension = os.path.splitext(output_filename)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # Keep a limited number of shards in memory while they are written
+            pending = collections.deque()
+            shard_number = 1
+            while shard:
+                shard_filename = output_base + '_' + str(shard_number) + output_extension
+                pending.append(executor.submit(write_output_shard, settings, shard_filename, header + shard))
+                if len(pending) > self.workers:
+                    pending.popleft().result()
+                shard, next_shard = next_shard, list(itertools.islice(rows, rows_per_shard))
+                shard_number += 1
+            for future in pending:
+                future.result()
+
+class FuzzyIndex():
+    """Index of rows on keys similar to the looked up keys
+
+    Similarity of 2 keys is the Dice coefficient of their sets of trigrams.
+    Keys are found through an index of their trigrams. Only keys whose
+    number of trigrams can reach the threshold, and which have one of the
+    rarest trigrams of the looked up key, are compared: a key similar
+    enough has at least a number of the trigrams, so one of any other
+    trigrams.
+    """
+    # Size of the n-grams
+    GRAM_SIZE = 3
+
+    def __init__(self, rows, key_function, threshold):
+        """Build the index
+
+        :param rows: Rows to index
+        :param key_function: Function which return the key of a row
+        :param threshold: Minimum similarity of matched keys, between 0 and 1
+        """
+        self.threshold = threshold
+        self.rows_by_key = {}
+        self.rows_count = 0
+        for position, row in enumerate(rows):
+            self.rows_by_key.setdefault(key_function(row), []).append((position, row))
+            self.rows_count += 1
+        # Keys are sorted on their number of n-grams, the keys of an n-gram too
+        grams_by_key = sorted(((key, self.get_grams(key)) for key in self.rows_by_key), key=lambda item: len(item[1]))
+        self.keys = [key for key, grams in grams_by_key]
+        self.grams = [grams for key, grams in grams_by_key]
+        self.grams_count = [len(grams) for grams in self.grams]
+        self.keys_by_gram = {}
+        for key_index, grams in enumerate(self.grams):
+            for gram in grams:
+                self.keys_by_gram.setdefault(gram, []).append(key_index)
+
+    def get_grams(self, key):
+        """Get the set of n-grams of a key
+
+        :param key: Key
+
+        :return: N-grams of the key
+        :rtype: Set
+        """
+        text = ' ' * (self.GRAM_SIZE - 1) + str(key) + ' '
+        return set(text[start:start + self.GRAM_SIZE] for start in range(len(text) - self.GRAM_SIZE + 1))
+
+    def get_candidates(self, grams):
+        """Get the keys which may be similar to a key
+
+        :param grams: N-grams of the looked up key
+
+        :return: Indexes of the keys in keys
+        :rtype: Set
+        """
+        grams_count = len(grams)
+        # Dice coefficient of sets of sizes a and b is at most 2 * min(a, b) / (a + b)
+        min_count = math.ceil(self.threshold * grams_count / (2 - self.threshold) - 1e-9)
+        max_count = math.floor((2 - self.threshold) * grams_count / self.threshold + 1e-9) if self.threshold > 0 else math.inf
+        start = bisect.bisect_left(self.grams_count, min_count)
+        end = bisect.bisect_right(self.grams_count, max_count)
+        # Similar keys have at least min_shared of the n-grams, so one of the others
+        min_shared = max(1, math.ceil(self.threshold * (grams_count + min_count) / 2 - 1e-9))
+        rarest_grams = sorted(grams, key=lambda gram: len(self.keys_by_gram.get(gram, ())))
+        candidates = set()
+        for gram in rarest_grams[:grams_count - min_shared + 1]:
+            key_indexes = self.keys_by_gram.get(gram)
+            if key_indexes:
+                candidates.update(key_indexes[bisect.bisect_left(key_indexes, start):bisect.bisect_left(key_indexes, end)])
+        return candidates
+
+    def get(self, key, default = None):
+        """Get the rows of the keys similar to a key
+
+        :param key: Looked up key
+        :param default: Value returned if no key is similar
+
+        :return: Rows of the similar keys, in the order of the indexed rows
+        :rtype: Array
+        """
+        grams = self.get_grams(key)
+        matched_rows = []
+        for key_index in self.get_candidates(grams):
+            shared = len(grams & self.grams[key_index])
+            if 2 * shared >= self.threshold * (len(grams) + self.grams_count[key_index]):
+                matched_rows.append(self.rows_by_key[self.keys[key_index]])
+        if not matched_rows:
+            return default
+        return [row for position, row in heapq.merge(*matched_rows)] if len(matched_rows) > 1 \
+            else [row for position, row in matched_rows[0]]
+
+    def __len__(self):
+        return len(self.keys)
+
+class SpillBuffer():
+    """Array of rows kept in memory up to a size, then in a temporary file
+
+    Rows are added with append, then read once in the order of addition.
+    """
+    memory_budget = 0
+    rows = []
+    size = 0
+    spill_file = None
+
+    def __init__(self, memory_budget):
+        """Constructor of the class
+
+        :param memory_budget: Memory for the rows in memory, in bytes
+        """
+        self.memory_budget = memory_budget
+        self.rows = []
+        self.size = 0
+        self.spill_file = None
+
+    def append(self, row):
+        """Add a row
+
+        :param row: Row
+        """
+        self.rows.append(row)
+        self.size += row_size(row)
+        if self.size > self.memory_budget:
+            if self.spill_file is None:
+                self.spill_file = tempfile.TemporaryFile()
+            pickle.dump(self.rows, self.spill_file, pickle.HIGHEST_PROTOCOL)
+            self.rows = []
+            self.size = 0
+
+    def __iter__(self):
+        if self.spill_file is not None:
+            with self.spill_file:
+                self.spill_file.seek(0)
+                while True:
+                    try:
+                        chunk = pickle.load(self.spill_file)
+                    except EOFError:
+                        break
+                    yield from chunk
+            self.spill_file = None
+        yield from self.rows
+
+class BloomFilter():
+    """Set of keys in a bit array, with false positives and without false negatives
+
+    Much smaller than a set of the keys, but several times slower to fill
+    and to look up.
+    """
+    bits_count = 0
+    hashes_count = 0
+    bits = None
+
+    def __init__(self, capacity, error_rate):
+        """Constructor of the class
+
+        :param capacity: Number of keys to add
+        :param error_rate: Rate of false positives with this number of keys
+        """
+        self.bits_count = max(64, int(-max(capacity, 1) * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes_count = max(1, round(self.bits_count / max(capacity, 1) * math.log(2)))
+        self.bits = bytearray((self.bits_count + 7) // 8)
+
+    def get_positions(self, key):
+        """Get the positions of the bits of a key
+
+        The builtin hash of the key is mixed, then split in the 2 hashes of
+        a double hashing. Equal keys have the same positions, as keys of a
+        dict, equal numbers too. Positions change between processes.
+
+        :param key: Key
+
+        :return: Positions of the bits
+        :rtype: Generator
+        """
+        mixed_hash = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        bits_count = self.bits_count
+        position = (mixed_hash >> 32) % bits_count
+        step = ((mixed_hash & 0xFFFFFFFF) | 1) % bits_count
+        for hash_index in range(self.hashes_count):
+            yield position
+            position += step
+            if position >= bits_count:
+                position -= bits_count
+
+    def add(self, key):
+        """Add a key
+
+        :param key: Key
+        """
+        bits = self.bits
+        for position in self.get_positions(key):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        for position in self.get_positions(key):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+class MatchStats():
+    """Statistics of a match process
+
+    Time is counted for one phase at once: time spent to read rows during the
+    match is counted in the read phases, not in the match phase.
+    """
+    # Names of the counters
+    COUNTERS = ['rows_read_1', 'rows_read_2', 'index_keys', 'index_rows', 'duplicate_keys',
+                'matched_rows', 'unmatched_rows', 'output_rows']
+
+    def __init__(self):
+        """Constructor of the class
+        """
+        self.start_time = time.perf_counter()
+        self.last_progress_time = self.start_time
+        self.phase = None
+        self.phase_wall_time = self.start_time
+        self.phase_cpu_time = time.process_time()
+        self.phases = {}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def switch_phase(self, phase):
+        """Count the time of the current phase and start another phase
+
+        :param phase: Name of the new phase, None to stop counting
+
+        :return: Name of the previous phase
+        :rtype: String
+        """
+        previous_phase = self.phase
+        if phase != previous_phase:
+            wall_time = time.perf_counter()
+            cpu_time = time.process_time()
+            if previous_phase is not None:
+                times = self.phases.setdefault(previous_phase, {'wall': 0.0, 'cpu': 0.0})
+                times['wall'] += wall_time - self.phase_wall_time
+                times['cpu'] += cpu_time - self.phase_cpu_time
+            self.phase = phase
+            self.phase_wall_time = wall_time
+            self.phase_cpu_time = cpu_time
+        return previous_phase
+
+    def is_progress_due(self, interval):
+        """Test if the progress must be sent
+
+        :param interval: Seconds between 2 progress events
+
+        :return: True if the last progress is older than the interval
+        :rtype: Boolean
+        """
+        now = time.perf_counter()
+        if now - self.last_progress_time >= interval:
+            self.last_progress_time = now
+            return True
+        return False
+
+    def get_progress(self):
+        """Get the counters and the speed of the process
+
+        :return: Counters, elapsed seconds and rows read per second
+        :rtype: Dict
+        """
+        progress = dict(self.counters)
+        progress['elapsed'] = time.perf_counter() - self.start_time
+        rows_read = self.counters['rows_read_1'] + self.counters['rows_read_2']
+        progress['rows_per_second'] = rows_read / progress['elapsed'] if progress['elapsed'] > 0 else 0.0
+        return progress
+
+    def get_peak_rss(self):
+        """Get the peak of resident memory of the process
+
+        :return: Size in bytes, None if not available on the system
+        :rtype: Integer
+        """
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes, except on macOS
+        return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+    def get_stats(self):
+        """Get all the statistics
+
+        :return: Times by phase, counters, elapsed seconds and peak of memory
+        :rtype: Dict
+        """
+        return {
+            'phases': self.phases,
+            'counters': self.counters,
+            'elapsed': time.perf_counter() - self.start_time,
+            'peak_rss': self.get_peak_rss()
+        }
+
+class MatchIndex():
+    """Index of an input file on its match column, stored in an index file
+
+    The file is memory-mapped, the rows of a key are read only when the key
+    is looked up.
+    """
+    header = None
+    match_column = -1
+    columns = None
+    normalizations = []
+    offsets = {}
+
+    def __init__(self, index_filename):
+        """Open an index file written by Matcher.write_index
+
+        :param index_filename: Path of the index file
+        """
+        if not os.path.exists(index_filename):
+            raise Exception('Error: Index file not found.')
+        with open(index_filename, 'rb') as index_file:
+            self.data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(Matcher.INDEX_MAGIC)] != Matcher.INDEX_MAGIC:
+            self.data.close()
+            raise Exception('Error: Bad index file.')
+        footer_offset = int.from_bytes(self.data[-8:], 'little')
+        footer = pickle.loads(self.data[footer_offset:-8])
+        self.header = footer['header']
+        self.match_column = footer['match_column']
+        self.columns = footer.get('columns')
+        self.normalizations = footer.get('normalizations', [])
+        self.offsets = footer['offsets']
+
+    def get(self, key, default = None):
+        """Get the rows of a key
+
+        :param key: Value of the match column
+        :param default: Value returned if the key is missing
+
+        :return: Rows with the key, in the order of the input file
+        :rtype: Array
+        """
+        position = self.offsets.get(key)
+        if position is None:
+            return default
+        return pickle.loads(self.data[position[0]:position[1]])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        """Close the index file
+        """
+        self.data.close()
+
+class MatchServer():
+    """Server which answer key lookups in indexed input files
+
+    Input files are read and indexed once, and read again when their
+    modification time changes. Requests and responses are JSON objects, one
+    per line:
+    - {"key": KEY} returns {"rows": MERGED_ROWS}
+    - {"keys": [KEY, ...]} returns {"results": [MERGED_ROWS, ...]}
+    - {"header": true} returns {"header": MERGED_HEADER}
+    A "table" member selects the input file by its name without extension,
+    the first input file by default. KEY is an array for several match
+    columns. Merged rows have the key, then the other columns of the row.
+    """
+    # Maximum size of a request line, in bytes
+    MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+    matcher = None
+    tables = {}
+    table_names = []
+
+    def __init__(self, matcher, tables):
+        """Constructor of the class
+
+        :param matcher: Matcher with the options to read the input files
+        :param tables: Array of tuples (input file, match column)
+        """
+        self.matcher = matcher
+        self.tables = {}
+        self.table_names = []
+        for input_filename, match_column in tables:
+            if not os.path.exists(input_filename):
+                raise Exception('Error: input file missing')
+            name = os.path.splitext(os.path.basename(input_filename))[0]
+            if isinstance(match_column, list):
+                match_index = tuple(column - 1 for column in match_column)
+            else:
+                match_index = match_column - 1
+            self.tables[name] = {'filename': input_filename, 'match_index': match_index, 'mtime': None}
+            self.table_names.append(name)
+
+    def get_table(self, name = None):
+        """Get a table, read and index the input file if it is modified
+
+        :param name: Name of the table, the first table by default
+
+        :return: Table with the header and the index of the input file
+        :rtype: Dict
+        """
+        table = self.tables.get(self.table_names[0] if name is None else name)
+        if table is None:
+            raise Exception('Error: unknown table')
+        mtime = os.stat(table['filename']).st_mtime_ns
+        if table['mtime'] != mtime:
+            rows = self.matcher.iter_input_data(table['filename'])
+            table['header'] = next(rows, None)
+            table['index'] = self.matcher.build_index(rows, self.matcher.build_key_function(table['match_index']))
+            table['mtime'] = mtime
+        return table
+
+    def lookup(self, table, key):
+        """Get the merged rows of a key
+
+        :param table: Table returned by get_table
+        :param key: Value of the match column, or array of values
+
+        :return: Merged rows, empty if the key is missing
+        :rtype: Array
+        """
+        match_index = table['match_index']
+        if isinstance(match_index, tuple):
+            if not isinstance(key, list) or len(key) != len(match_index):
+                raise Exception('Error: bad key')
+            key = self.matcher.build_key_function(tuple(range(len(key))))(key)
+        else:
+            key = self.matcher.build_key_function(0)([key])
+        return [self.merge_row(table, row) for row in table['index'].get(key, ())]
+
+    def merge_row(self, table, row):
+        """Put the match columns of a row of a table first
+
+        :param table: Table returned by get_table
+        :param row: Row of the table
+
+        :return: Matched data, then the other columns of the row
+        :rtype: Array
+        """
+        match_index = table['match_index']
+        return self.matcher.merge_rows(row, (), match_index, match_index if isinstance(match_index, tuple) else 0)
+
+    def handle_request(self, request):
+        """Answer a request
+
+        :param request: Request, see the description of the class
+
+        :return: Response
+        :rtype: Dict
+        """
+        try:
+            table = self.get_table(request.get('table'))
+            if 'keys' in request:
+                return {'results': [self.lookup(table, key) for key in request['keys']]}
+            if 'key' in request:
+                return {'rows': self.lookup(table, request['key'])}
+            if request.get('header'):
+                return {'header': None if table['header'] is None else self.merge_row(table, table['header'])}
+            return {'error': 'Error: bad request'}
+        except Exception as e:
+            return {'error': str(e)}
+
+    async def handle_connection(self, reader, writer):
+        """Answer the requests of a connection, one JSON object per line
+
+        The connection is closed after a request longer than MAX_REQUEST_SIZE.
+
+        :param reader: Stream of the requests
+        :param writer: Stream of the responses
+        """
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    response = self.handle_request(json.loads(line))
+                except ValueError:
+                    response = {'error': 'Error: bad request'}
+                writer.write(json.dumps(response, default=str).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ValueError:
+            # Line longer than the limit of the reader
+            writer.write(json.dumps({'error': 'Error: request too long'}).encode('utf-8') + b'\n')
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path = None, port = None):
+        """Listen on a Unix socket or on a local TCP port until cancelled
+
+        :param socket_path: Path of the Unix socket
+        :param port: TCP port on localhost
+        """
+        import asyncio
+        for name in self.table_names:
+            self.get_table(name)
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=socket_path, limit=self.MAX_REQUEST_SIZE)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host='127.0.0.1', port=port, limit=self.MAX_REQUEST_SIZE)
+        async with server:
+            await server.serve_forever()
+
+def write_output_shard(settings, output_filename, output_data):
+    """Write the output data of a shard, run in a worker process
+
+    :param settings: Values of the attributes of the matcher used to write files
+    :param output_filename: Path of the output file of the shard
+    :param output_data: Data to write, with the header
+    """
+    matcher = Matcher()
+    for name, value in settings.items():
+        setattr(matcher, name, value)
+    matcher.write_output_data(output_filename, output_data)
+
+def partition_input_range(settings, input_number, input_filename, header, start, end, delimiter, partitions_count, directory):
+    """Split the rows of a range of an input file in partitions on their key, run in a worker process
+
+    :param settings: Values of the attributes of the matcher used to read the file
+    :param input_number: Number of the input
+    :param input_filename: Path of the input file, a CSV file
+    :param header: Header of the input, to find the columns by name
+    :param start: Position of the first byte of the range
+    :param end: Position after the last byte of the range
+    :param delimiter: Delimiter of the columns
+    :param partitions_count: Number of partitions
+    :param directory: Directory of the file of the partitions
+
+    :return: Path of the file of the partitions, position of each partition in the file and number of rows
+    :rtype: Dict
+    """
+    matcher = Matcher()
+    for name, value in settings.items():
+        setattr(matcher, name, value)
+    with open(input_filename, 'rb') as input_file:
+        input_file.seek(start)
+        text = input_file.read(end - start).decode(matcher.csv_encoding)
+    rows = csv.reader(io.StringIO(text, newline=''), delimiter=delimiter, quoting=matcher.CSV_QUOTING[matcher.csv_quoting])
+    columns = matcher.get_input_columns(input_number)
+    if columns is not None:
+        rows = matcher.project_rows(itertools.chain([header], rows), columns)
+        next(rows)
+    key_function = matcher.get_key_function(input_number)
+    partitions = [[] for partition in range(partitions_count)]
+    rows_count = 0
+    for position, row in enumerate(rows):
+        partitions[get_partition(key_function(row), partitions_count)].append((position, row))
+        rows_count += 1
+    offsets = []
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as partitions_file:
+        for partition in partitions:
+            offsets.append(partitions_file.tell())
+            pickle.dump(partition, partitions_file, pickle.HIGHEST_PROTOCOL)
+    return {'filename': partitions_file.name, 'offsets': offsets, 'rows_count': rows_count}
+
+def match_partition(settings, header_1, header_2, parts_1, parts_2, output_delimiter, directory):
+    """Match the rows of the inputs in a partition, run in a worker process
+
+    :param settings: Values of the attributes of the matcher used to match the rows
+    :param header_1: Header of the first input
+    :param header_2: Header of the second input
+    :param parts_1: Array of tuples (path, offset) of the rows of the partition in each range of the first input
+    :param parts_2: Array of tuples (path, offset) of the rows of the partition in each range of the second input
+    :param output_delimiter: Delimiter of the columns of the output
+    :param directory: Directory of the file of the merged rows
+
+    :return: Path of the file of the merged rows, position in the file of
+             the merged rows of each range of the first input, and counters
+    :rtype: Dict
+    """
+    matcher = Matcher()
+    for name, value in settings.items():
+        setattr(matcher, name, value)
+    columns_2 = matcher.get_input_columns(2)
+    rows_2 = [header_2 if columns_2 is None else next(matcher.project_rows([header_2], columns_2))]
+    for filename, offset in parts_2:
+        rows_2.extend(row for position, row in read_partition(filename, offset))
+    if 'all' != matcher.duplicates_2:
+        rows_2 = matcher.iter_unique_rows(rows_2, 2)
+    rows_2 = iter(rows_2)
+    next(rows_2)
+    index = matcher.build_index(rows_2, matcher.get_key_function(2))
+
+    match_column_1 = matcher.get_match_index(1)
+    match_column_2 = matcher.get_match_index(2)
+    key_1 = matcher.get_key_function(1)
+    output_text = io.StringIO(newline='')
+    writer = csv.writer(output_text, delimiter=output_delimiter, quoting=matcher.CSV_QUOTING[matcher.csv_quoting])
+    offsets = []
+    matched = output_rows = 0
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as output_file:
+        for filename, offset in parts_1:
+            # Position of each matched row in the range, with the end of its merged rows in the text
+            text_ends = []
+            for position, input_1 in read_partition(filename, offset):
+                rows_matched = index.get(key_1(input_1))
+                if rows_matched is None:
+                    continue
+                matched += 1
+                output_rows += len(rows_matched)
+                for input_2 in rows_matched:
+                    writer.writerow(matcher.merge_rows(input_1, input_2, match_column_1, match_column_2))
+                text_ends.append((position, output_text.tell()))
+            text = output_text.getvalue()
+            output_text.seek(0)
+            output_text.truncate()
+            merged_rows = []
+            text_start = 0
+            for position, text_end in text_ends:
+                merged_rows.append((position, text[text_start:text_end]))
+                text_start = text_end
+            offsets.append(output_file.tell())
+            pickle.dump(merged_rows, output_file, pickle.HIGHEST_PROTOCOL)
+    return {'filename': output_file.name, 'offsets': offsets, 'matched_rows': matched, 'output_rows': output_rows}
+
+def read_partition(filename, offset):
+    """Read a partition written by partition_input_range or match_partition
+
+    :param filename: Path of the file of the partitions
+    :param offset: Position of the partition in the file
+
+    :return: Rows or merged rows of the partition, with their position
+    :rtype: Array
+    """
+    with open(filename, 'rb') as partitions_file:
+        partitions_file.seek(offset)
+        return pickle.load(partitions_file)
+
+def get_partition(key, partitions_count):
+    """Get the partition of a key, the same in all processes
+
+    :param key: Match key
+    :param partitions_count: Number of partitions
+
+    :return: Number of the partition, from 0
+    :rtype: Integer
+    """
+    return zlib.crc32(repr(key).encode('utf-8')) % partitions_count
+
+def sort_key(value):
+    """Get a key to sort values of different types
+
+    Numbers are sorted together, so 1 and 1.0 stay equal as in the hash
+    engine.
+
+    :param value: Value of a cell
+
+    :return: Comparable key
+    :rtype: Tuple
+    """
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (bool, int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, tuple):
+        # Key on several columns
+        return (4, tuple(sort_key(item) for item in value))
+    return (3, type(value).__name__, value)
+
+def merge_values(value_1, value_2, add_numbers):
+    """Merge the values of a column of 2 rows with the same key
+
+    :param value_1: Value of the first row, or values already merged
+    :param value_2: Value of the second row
+    :param add_numbers: True to add numbers, including texts of numbers
+
+    :return: Sum of the numbers, or the different values separated by commas
+    :rtype: Number or String
+    """
+    if value_2 is None or value_2 == '':
+        return value_1
+    if value_1 is None or value_1 == '':
+        return value_2
+    if add_numbers:
+        number_1 = to_number(value_1)
+        number_2 = to_number(value_2)
+        if number_1 is not None and number_2 is not None:
+            return number_1 + number_2
+    values = str(value_1).split(', ')
+    if str(value_2) in values:
+        return value_1
+    return str(value_1) + ', ' + str(value_2)
+
+def to_number(value):
+    """Convert a number or a text of a number to a number
+
+    :param value: Value
+
+    :return: Number, None if the value is not a number
+    :rtype: Number
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def get_record_fingerprints(records):
+    """Get the fingerprints of records of a CSV file, stable between runs
+
+    :param records: Records, in bytes
+
+    :return: Array of the fingerprints, from the 64 bits of 2 checksums of each record
+    :rtype: Array
+    """
+    return list(map(operator.or_, map(operator.lshift, map(zlib.crc32, records), itertools.repeat(32)),
+                    map(zlib.adler32, records)))
+
+def get_row_differences(previous_fingerprints, previous_keys, fingerprints, keys):
+    """Get the rows added and removed between 2 runs
+
+    Only the fingerprints whose number of rows differs are compared. The
+    other rows are in the same order if they are in the same order once
+    the rows with these fingerprints are removed.
+
+    :param previous_fingerprints: Fingerprints of the rows of the previous run
+    :param previous_keys: Keys of the rows of the previous run
+    :param fingerprints: Fingerprints of the rows
+    :param keys: Keys of the rows
+
+    :return: Number of added rows by key, number of removed rows by key,
+             and True if the other rows are in the same order
+    :rtype: Tuple
+    """
+    if not previous_fingerprints:
+        return collections.Counter(keys), collections.Counter(), True
+    previous_counts = collections.Counter(previous_fingerprints)
+    counts = collections.Counter(fingerprints)
+    added_rows = collections.Counter()
+    removed_rows = collections.Counter()
+    differences = {fingerprint for fingerprint, count in previous_counts.items() ^ counts.items()}
+    if differences:
+        previous_keys = dict(zip(previous_fingerprints, previous_keys))
+        keys = dict(zip(fingerprints, keys))
+        for fingerprint in differences:
+            difference = counts.get(fingerprint, 0) - previous_counts.get(fingerprint, 0)
+            if difference > 0:
+                added_rows[keys[fingerprint]] += difference
+            else:
+                removed_rows[previous_keys[fingerprint]] -= difference
+        same_order = [fingerprint for fingerprint in previous_fingerprints if fingerprint not in differences] == \
+            [fingerprint for fingerprint in fingerprints if fingerprint not in differences]
+    else:
+        same_order = previous_fingerprints == fingerprints
+    return added_rows, removed_rows, same_order
+
+def count_row_changes(added_rows, removed_rows, input_number):
+    """Count the rows inserted, changed and deleted in an input between 2 runs
+
+    A row removed and a row added with the same key is counted as changed.
+
+    :param added_rows: Number of added rows by key
+    :param removed_rows: Number of removed rows by key
+    :param input_number: Number of the input
+
+    :return: Number of inserted, changed and deleted rows, by name of counter
+    :rtype: Dict
+    """
+    changed = 0
+    for key in added_rows.keys() & removed_rows.keys():
+        changed += min(added_rows[key], removed_rows[key])
+    return {
+        'inserted_rows_' + str(input_number): sum(added_rows.values()) - changed,
+        'changed_rows_' + str(input_number): changed,
+        'deleted_rows_' + str(input_number): sum(removed_rows.values()) - changed
+    }
+
+def row_size(row):
+    """Estimate the memory used by a row
+
+    :param row: Row of data
+
+    :return: Size in bytes
+    :rtype: Integer
+    """
+    return sys.getsizeof(row) + sum(sys.getsizeof(col) for col in row)
+
+def match_rows(rows_1, rows_2, key_1, key_2, **options):
+    """Match rows of 2 iterables and merge them, without files
+
+    The first rows are the headers, as in input files. Rows are merged as
+    in the output files: the key, then the other columns of the first row,
+    then the other columns of the second row. With a key function, the key
+    is added before all the columns of the rows.
+
+    :param rows_1: Iterable of the rows of the first input
+    :param rows_2: Iterable of the rows of the second input
+    :param key_1: Number of the match column (start at 1), array of numbers,
+                  or function which return the key of a row
+    :param key_2: Match column or key function of the second input
+    :param options: Attributes of Matcher in Matcher.ROWS_OPTIONS, as
+                    match_engine, ignore_header, normalizations... The join
+                    mode is inner, or anti for the rows of the first input
+                    without match.
+
+    :return: Iterator of the merged rows, the inputs are read while it is consumed
+    :rtype: Iterator
+    """
+    matcher = Matcher()
+    for name, value in options.items():
+        if not hasattr(matcher, name):
+            raise TypeError('Unknown option: ' + name)
+        if name not in Matcher.ROWS_OPTIONS:
+            raise TypeError('Option not supported without files: ' + name)
+        setattr(matcher, name, value)
+    if matcher.join_mode not in ['inner', 'anti']:
+        raise TypeError('Join mode not supported without files: ' + str(matcher.join_mode))
+    inputs = []
+    for rows, key in [(rows_1, key_1), (rows_2, key_2)]:
+        if callable(key):
+            rows = iter_keyed_rows(rows, key)
+            key = 1
+        inputs.append((rows, key))
+    (matcher.input_data_1, matcher.match_column_1), (matcher.input_data_2, matcher.match_column_2) = inputs
+    if 'anti' == matcher.join_mode:
+        return matcher.iter_match_join()[0]
+    return matcher.iter_match()
+
+def iter_keyed_rows(rows, key_function):
+    """Add the key of each row as its first column
+
+    :param rows: Iterable of rows, the first one is the header
+    :param key_function: Function which return the key of a row
+
+    :return: Generator of the rows with their key, 'key' in the header
+    :rtype: Generator
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    yield ['key'] + list(header)
+    for row in rows:
+        yield [key_function(row)] + list(row)
+
+def usage(exec_name):
+    """Show usage for help.
+    :param exec_name: Path of this script
+    """
+
+    # Get only executable name without the path
+    if os.path.sep in exec_name:
+        exec_name = exec_name.split(os.path.sep)[-1:][0]
+        
+    print(exec_name+" [options] input_file_1 match_column_1 input_file_2 match_column_2 [input_file_3 match_column_3 ...] output_file")
+    print(exec_name+" [options] index input_file match_column index_file")
+    print(exec_name+" [options] batch index_file match_column input_file [input_file ...] --out-dir=DIRECTORY")
+    print(exec_name+" [options] serve input_file match_column [input_file match_column ...] --socket=PATH|--port=PORT")
+    print(exec_name+" --cache-dir=DIRECTORY --clear-cache")
+    print("Match column: number of the column, or numbers separated by commas for a key on several columns")
+    print("Options : ")
+    print(" --no-header")
+    print(" --output-sheetname=SHEETNAME")
+    print(" --engine=hash|nested|sort-merge")
+    print(" --sort-merge")
+    print(" --memory-budget=MB")
+    print(" --workers=N")
+    print(" --cache-dir=DIRECTORY")
+    print(" --cache-size=MB")
+    print(" --clear-cache")
+    print(" --out-dir=DIRECTORY")
+    print(" --columns-1=COLUMN,COLUMN...")
+    print(" --columns-2=COLUMN,COLUMN...")
+    print(" --sheets-1=SHEET,SHEET...")
+    print(" --sheets-2=SHEET,SHEET...")
+    print(" --delimiter=CHARACTER")
+    print(" --encoding=ENCODING")
+    print(" --quoting=minimal|all|nonnumeric|none")
+    print(" --normalize[=case,space,accents,numbers]")
+    print(" --fuzzy=THRESHOLD")
+    print(" --prefilter=bloom|set")
+    print(" --rows-per-shard=N")
+    print(" --shard-mode=sheets|files")
+    print(" --join=inner|left|right|full|anti")
+    print(" --duplicates-1=all|first|last|concat|aggregate|error|cap:K")
+    print(" --duplicates-2=all|first|last|concat|aggregate|error|cap:K")
+    print(" --stats")
+    print(" --stats-file=FILE")
+    print(" --state=FILE")
+    print(" --socket=PATH")
+    print(" --port=PORT")
+    print(" --progress=SECONDS")
+    
+# Entry point
+if __name__ == '__main__':
+    argv = sys.argv
+    matcher = Matcher()
+    command = argv[1] if len(argv) > 1 else ''
+    cache_only = len(argv) > 1 and all('--' == arg[:2] for arg in argv[1:])
+    if cache_only:
+        result, err = matcher.read_clear_cache_argv(argv)
+    elif 'index' == command:
+        result, err = matcher.read_index_argv(argv)
+    elif 'batch' == command:
+        result, err = matcher.read_batch_argv(argv)
+    elif 'serve' == command:
+        result, err, tables = matcher.read_serve_argv(argv)
+    else:
+        result, err = matcher.read_argv(argv)
+    if result:
+        if matcher.clear_cache_first:
+            matcher.clear_cache()
+        arguments = [arg for arg in argv if '--' != arg[:2]]
+        if 'index' == command:
+            matcher.write_index(arguments[2], arguments[4])
+        elif 'batch' == command:
+            matcher.start_batch(arguments[2], arguments[4:])
+        elif 'serve' == command:
+            import asyncio
+            server = MatchServer(matcher, tables)
+            try:
+                asyncio.run(server.serve(matcher.server_socket, matcher.server_port))
+            except KeyboardInterrupt:
+                pass
+        elif not cache_only:
+            matcher.start(arguments[1], arguments[3], arguments[-1])
+    else:
+        usage(argv[0])
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark pymatcher.Matcher phases on synthetic input files.
+"""
+__author__ = "Sylvain Dangin"
+__licence__ = "Apache 2.0"
+__version__ = "1.0"
+__maintainer__ = "Sylvain Dangin"
+__email__ = "sylvain.dangin@gmail.com"
+__status__ = "Development"
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pymatcher import Matcher
+
+class Benchmark():
+    # Maximum number of rows in a xls file
+    XLS_MAX_ROWS = 65535
+
+    rows = 0
+    columns = 0
+    key_cardinality = 0
+    duplicate_rate = 0.0
+    match_rate = 0.0
+    formats = []
+    engines = []
+    repeat = 1
+    measure_memory = True
+    seed = 0
+    output_filename = None
+    baseline_filename = None
+    threshold = 0.0
+
+    def __init__(self):
+        """Constructor of the class
+        """
+        self.set_default_values()
+
+    def set_default_values(self):
+        """Set default values of the class
+        """
+        self.rows = 10000
+        self.columns = 10
+        self.key_cardinality = 10000
+        self.duplicate_rate = 0.1
+        self.match_rate = 0.5
+        self.formats = ['xlsx', 'xls', 'csv']
+        self.engines = ['hash']
+        self.repeat = 3
+        self.measure_memory = True
+        self.seed = 0
+        self.output_filename = None
+        self.baseline_filename = None
+        self.threshold = 0.2
+
+    def generate_input_data(self):
+        """Generate the data of the 2 input files
+
+        The match column is the first column. Keys of the first input are
+        drawn from key_cardinality values, duplicate_rate of the rows reuse a
+        key of a previous row. match_rate of the rows of the second input
+        have a key of the first input.
+
+        :return: Data of the 2 inputs
+        :rtype: Tuple
+        """
+        generator = random.Random(self.seed)
+        header = ['Key'] + ['Column ' + str(col_index) for col_index in range(1, self.columns)]
+        keys_1 = []
+        for row_index in range(self.rows):
+            if keys_1 and generator.random() < self.duplicate_rate:
+                keys_1.append(generator.choice(keys_1))
+            else:
+                keys_1.append('K' + str(generator.randrange(self.key_cardinality)))
+        keys_2 = []
+        for row_index in range(self.rows):
+            if generator.random() < self.match_rate:
+                keys_2.append(generator.choice(keys_1))
+            else:
+                # Keys outside of the keys of the first input
+                keys_2.append('K' + str(self.key_cardinality + generator.randrange(self.key_cardinality)))
+        input_data = []
+        for keys in [keys_1, keys_2]:
+            data = [header]
+            for key in keys:
+                data.append([key] + [generator.randrange(1000000) for col_index in range(1, self.columns)])
+            input_data.append(data)
+        return input_data[0], input_data[1]
+
+    def measure(self, function):
+        """Measure the time and the memory used by a function
+
+        :param function: Function without argument
+
+        :return: Best time in seconds, peak of memory in bytes, result of the function
+        :rtype: Tuple
+        """
+        best_time = None
+        result = None
+        for run in range(self.repeat):
+            start_time = time.perf_counter()
+            result = function()
+            elapsed_time = time.perf_counter() - start_time
+            if best_time is None or elapsed_time < best_time:
+                best_time = elapsed_time
+        peak_memory = None
+        if self.measure_memory:
+            tracemalloc.start()
+            function()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return best_time, peak_memory, result
+
+    def run(self):
+        """Run the benchmark of each format and engine
+
+        :return: Results by case and phase
+        :rtype: Dict
+        """
+        input_data_1, input_data_2 = self.generate_input_data()
+        results = {
+            'parameters': {
+                'rows': self.rows,
+                'columns': self.columns,
+                'key_cardinality': self.key_cardinality,
+                'duplicate_rate': self.duplicate_rate,
+                'match_rate': self.match_rate,
+                'seed': self.seed
+            },
+            'cases': {}
+        }
+        directory = tempfile.mkdtemp()
+        try:
+            for file_format in self.formats:
+                if file_format == 'xls' and self.rows > self.XLS_MAX_ROWS:
+                    continue
+                matcher = Matcher()
+                input1_filename = os.path.join(directory, 'input1.' + file_format)
+                input2_filename = os.path.join(directory, 'input2.' + file_format)
+                output_filename = os.path.join(directory, 'output.' + file_format)
+                matcher.write_output_data(input1_filename, input_data_1)
+                matcher.write_output_data(input2_filename, input_data_2)
+                for engine in self.engines:
+                    phases = {}
+                    matcher.match_engine = engine
+                    matcher.match_column_1 = 1
+                    matcher.match_column_2 = 1
+                    seconds, memory, data_1 = self.measure(lambda: list(matcher.iter_input_data(input1_filename)))
+                    phases['read_1'] = {'seconds': seconds, 'peak_memory': memory, 'rows': len(data_1)}
+                    seconds, memory, data_2 = self.measure(lambda: list(matcher.iter_input_data(input2_filename)))
+                    phases['read_2'] = {'seconds': seconds, 'peak_memory': memory, 'rows': len(data_2)}
+                    matcher.input_data_1 = data_1
+                    matcher.input_data_2 = data_2
+                    seconds, memory, output_data = self.measure(matcher.match)
+                    phases['match'] = {'seconds': seconds, 'peak_memory': memory, 'rows': len(output_data)}
+                    if file_format != 'xls' or len(output_data) <= self.XLS_MAX_ROWS:
+                        seconds, memory, result = self.measure(lambda: matcher.write_output_data(output_filename, output_data))
+                        phases['write'] = {'seconds': seconds, 'peak_memory': memory, 'rows': len(output_data)}
+                    results['cases'][file_format + '-' + engine] = phases
+        finally:
+            shutil.rmtree(directory)
+        return results
+
+    def compare(self, results, baseline):
+        """Compare results with the results of a baseline
+
+        :param results: Results of the run
+        :param baseline: Results of the baseline
+
+        :return: Regressions, as messages
+        :rtype: Array
+        """
+        regressions = []
+        for case, phases in results['cases'].items():
+            for phase, measures in phases.items():
+                base_measures = baseline.get('cases', {}).get(case, {}).get(phase)
+                if base_measures is None:
+                    continue
+                for measure in ['seconds', 'peak_memory']:
+                    value = measures.get(measure)
+                    base_value = base_measures.get(measure)
+                    if value is not None and base_value and value > base_value * (1 + self.threshold):
+                        regressions.append('%s %s %s: %g instead of %g (+%d%%)' % (
+                            case, phase, measure, value, base_value, round((value / base_value - 1) * 100)))
+        return regressions
+
+    def read_argv(self, argv):
+        """Read command line arguments and extract params
+        """
+        self.set_default_values()
+        try:
+            for arg in argv[1:]:
+                if '--' != arg[:2]:
+                    return False, 'Bad argument'
+                option = arg[2:].split('=')[0]
+                value = arg.split('=', 1)[1] if '=' in arg else ''
+                if 'rows' == option:
+                    self.rows = int(value)
+                elif 'columns' == option:
+                    self.columns = int(value)
+                elif 'cardinality' == option:
+                    self.key_cardinality = int(value)
+                elif 'duplicate-rate' == option:
+                    self.duplicate_rate = float(value)
+                elif 'match-rate' == option:
+                    self.match_rate = float(value)
+                elif 'formats' == option:
+                    self.formats = value.split(',')
+                elif 'engines' == option:
+                    self.engines = value.split(',')
+                elif 'repeat' == option:
+                    self.repeat = int(value)
+                elif 'no-memory' == option:
+                    self.measure_memory = False
+                elif 'seed' == option:
+                    self.seed = int(value)
+                elif 'output' == option:
+                    self.output_filename = value
+                elif 'baseline' == option:
+                    self.baseline_filename = value
+                elif 'threshold' == option:
+                    self.threshold = float(value)
+                else:
+                    return False, 'Bad argument'
+            if self.rows < 0 or self.columns < 1 or self.key_cardinality < 1 or self.repeat < 1:
+                return False, 'Bad argument'
+            return True, ''
+        except Exception as e:
+            return False, 'Error in arguments'
+
+def usage(exec_name):
+    """Show usage for help.
+    :param exec_name: Path of this script
+    """
+    exec_name = os.path.basename(exec_name)
+    print(exec_name+" [options]")
+    print("Options : ")
+    print(" --rows=N")
+    print(" --columns=N")
+    print(" --cardinality=N")
+    print(" --duplicate-rate=RATE")
+    print(" --match-rate=RATE")
+    print(" --formats=xlsx,xls,csv")
+    print(" --engines=hash,nested,sort-merge")
+    print(" --repeat=N")
+    print(" --no-memory")
+    print(" --seed=N")
+    print(" --output=RESULTS_FILE")
+    print(" --baseline=BASELINE_FILE")
+    print(" --threshold=RATE")
+
+# Entry point
+if __name__ == '__main__':
+    benchmark = Benchmark()
+    result, err = benchmark.read_argv(sys.argv)
+    if not result:
+        usage(sys.argv[0])
+        sys.exit(2)
+    results = benchmark.run()
+    if benchmark.output_filename is not None:
+        with open(benchmark.output_filename, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    print(json.dumps(results, indent=2))
+    if benchmark.baseline_filename is not None:
+        with open(benchmark.baseline_filename) as baseline_file:
+            regressions = benchmark.compare(results, json.load(baseline_file))
+        for regression in regressions:
+            print('Regression: ' + regression)
+        if regressions:
+            sys.exit(1)
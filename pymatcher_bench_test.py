@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test pymatcher_bench.Benchmark class.
+"""
+__author__ = "Sylvain Dangin"
+__licence__ = "Apache 2.0"
+__version__ = "1.0"
+__maintainer__ = "Sylvain Dangin"
+__email__ = "sylvain.dangin@gmail.com"
+__status__ = "Development"
+
+import unittest
+from pymatcher_bench import Benchmark
+
+class BenchmarkTest(unittest.TestCase):
+    # self.benchmark object
+    benchmark = None
+
+    def setUp(self):
+        """Initialise self.benchmark class
+        """
+        self.benchmark = Benchmark()
+
+    def test_generate_input_data(self):
+        """Test size and match rate of generated data
+        """
+        self.benchmark.rows = 1000
+        self.benchmark.columns = 5
+        self.benchmark.match_rate = 0.3
+        data_1, data_2 = self.benchmark.generate_input_data()
+        self.assertEqual(1001, len(data_1))
+        self.assertEqual(1001, len(data_2))
+        self.assertEqual(5, len(data_1[0]))
+        keys_1 = set(row[0] for row in data_1[1:])
+        matched = len([row for row in data_2[1:] if row[0] in keys_1])
+        self.assertTrue(200 < matched < 400)
+        # Same seed, same data
+        self.assertEqual((data_1, data_2), self.benchmark.generate_input_data())
+
+    def test_duplicate_rate(self):
+        """Test rate of duplicated keys in generated data
+        """
+        self.benchmark.rows = 1000
+        self.benchmark.key_cardinality = 1000000
+        self.benchmark.duplicate_rate = 0
+        data_1, data_2 = self.benchmark.generate_input_data()
+        self.assertTrue(len(set(row[0] for row in data_1[1:])) > 990)
+        self.benchmark.duplicate_rate = 0.5
+        data_1, data_2 = self.benchmark.generate_input_data()
+        self.assertTrue(len(set(row[0] for row in data_1[1:])) < 600)
+
+    def test_run(self):
+        """Test phases measured by a run
+        """
+        self.benchmark.rows = 50
+        self.benchmark.repeat = 1
+        self.benchmark.formats = ['csv', 'xlsx']
+        self.benchmark.engines = ['hash', 'nested']
+        results = self.benchmark.run()
+        self.assertEqual(['csv-hash', 'csv-nested', 'xlsx-hash', 'xlsx-nested'], sorted(results['cases']))
+        phases = results['cases']['csv-hash']
+        self.assertEqual(['match', 'read_1', 'read_2', 'write'], sorted(phases))
+        self.assertEqual(51, phases['read_1']['rows'])
+        self.assertEqual(phases['match']['rows'], results['cases']['xlsx-nested']['match']['rows'])
+        self.assertTrue(phases['match']['peak_memory'] > 0)
+
+    def test_compare(self):
+        """Test detection of regressions
+        """
+        baseline = {'cases': {'csv-hash': {'match': {'seconds': 1.0, 'peak_memory': 1000}}}}
+        results = {'cases': {'csv-hash': {'match': {'seconds': 1.1, 'peak_memory': 1000}, 'write': {'seconds': 1.0}}}}
+        self.assertEqual([], self.benchmark.compare(results, baseline))
+        results['cases']['csv-hash']['match']['seconds'] = 1.5
+        regressions = self.benchmark.compare(results, baseline)
+        self.assertEqual(1, len(regressions))
+        self.assertTrue('match seconds' in regressions[0])
+
+    def test_read_argv(self):
+        """Test command line arguments
+        """
+        test, err = self.benchmark.read_argv(['exec', '--rows=100', '--formats=csv', '--no-memory', '--threshold=0.5'])
+        self.assertEqual(True, test)
+        self.assertEqual(100, self.benchmark.rows)
+        self.assertEqual(['csv'], self.benchmark.formats)
+        self.assertEqual(False, self.benchmark.measure_memory)
+        self.assertEqual(0.5, self.benchmark.threshold)
+        test, err = self.benchmark.read_argv(['exec', '--rows=A'])
+        self.assertEqual(False, test)
+        test, err = self.benchmark.read_argv(['exec', 'input'])
+        self.assertEqual(False, test)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,11 +9,15 @@ __maintainer__ = "Sylvain Dangin"
 __email__ = "sylvain.dangin@gmail.com"
 __status__ = "Development"
 
+import asyncio
+import json
 import os
+import subprocess
+import sys
 import unittest
 import xlrd
 import openpyxl
-from pymatcher import Matcher
+from pymatcher import Matcher, MatchIndex, MatchServer, MatchStats, BloomFilter, FuzzyIndex, SpillBuffer, match_rows
 
 class MatcherTest(unittest.TestCase):
     # Base tests data
@@ -133,6 +137,13 @@ class MatcherTest(unittest.TestCase):
         data = self.matcher.read_input_data_from_xlsx(self.TEST_FILE_1_PATH)
         self.assertEqual(self.TESTS_DATA_1[1][2], data[1][2])
 
+    def test_iter_input_data_from_xlsx(self):
+        """Test read xlsx method as a stream of rows
+        """
+        rows = self.matcher.iter_input_data_from_xlsx(self.TEST_FILE_1_PATH)
+        self.assertEqual(self.TESTS_DATA_1[0], next(rows))
+        self.assertEqual(self.TESTS_DATA_1[1:], list(rows))
+
     def test_write_output_data_to_xlsx(self):
         """Test write xlsx method
         """
@@ -145,6 +156,118 @@ class MatcherTest(unittest.TestCase):
         self.matcher.write_output_data_to_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xls', self.TESTS_DATA_1, 'just_a_sheet')
         self.assertEqual(self.TESTS_DATA_1[1][2], self.get_cell_in_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', 2, 3, 'just_a_sheet'))
 
+    def test_write_output_data_from_generator(self):
+        """Test write methods with rows produced by a generator
+        """
+        rows = (['Row', index] for index in range(2500))
+        self.matcher.write_output_data_to_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', rows)
+        self.assertEqual(2499, self.get_cell_in_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', 2500, 2))
+        rows = (['Row', index] for index in range(2500))
+        self.matcher.write_output_data_to_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', rows)
+        self.assertEqual(2499, self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 2500, 2))
+
+    def test_write_output_data_in_sheets(self):
+        """Test split of the output in sheets, with the header in each sheet
+        """
+        self.matcher.rows_per_shard = 3
+        self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH+'.xlsx', self.TESTS_DATA_2)
+        workbook = openpyxl.load_workbook(self.OUTPUT_BASE_FILE_PATH+'.xlsx')
+        self.assertEqual(['match', 'match_2'], workbook.sheetnames)
+        self.assertEqual(self.TESTS_DATA_2[:4], [list(row) for row in workbook['match'].values])
+        self.assertEqual([self.TESTS_DATA_2[0], self.TESTS_DATA_2[4]], [list(row) for row in workbook['match_2'].values])
+        # Maximum number of rows of xls sheets
+        self.matcher.rows_per_shard = None
+        self.matcher.XLS_MAX_ROWS = 3
+        self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH+'.xls', self.TESTS_DATA_2)
+        workbook = xlrd.open_workbook(self.OUTPUT_BASE_FILE_PATH+'.xls')
+        self.assertEqual(['match', 'match_2'], workbook.sheet_names())
+        self.assertEqual(self.TESTS_DATA_2[0], workbook.sheet_by_index(1).row_values(0))
+        self.assertEqual(self.TESTS_DATA_2[3], workbook.sheet_by_index(1).row_values(1))
+
+    def test_write_output_data_in_files(self):
+        """Test split of the output in files written in parallel
+        """
+        self.matcher.rows_per_shard = 3
+        self.matcher.workers = 2
+        self.matcher.shard_mode = 'files'
+        rows = (row for row in [['Row', 'Index']] + [['Row', str(index)] for index in range(8)])
+        self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH+'.csv', rows)
+        self.assertFalse(os.path.exists(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        for shard_number, indexes in [(1, ['0', '1', '2']), (2, ['3', '4', '5']), (3, ['6', '7'])]:
+            result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'_'+str(shard_number)+'.csv'))
+            self.assertEqual([['Row', 'Index']] + [['Row', index] for index in indexes], result)
+        self.assertFalse(os.path.exists(self.OUTPUT_BASE_FILE_PATH+'_4.csv'))
+        # All the rows in one file
+        self.matcher.rows_per_shard = 10
+        self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH+'.xlsx', self.TESTS_DATA_2)
+        self.assertEqual('Karl DO', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 5, 2))
+
+    def test_iter_input_data_from_xls(self):
+        """Test read xls method as a stream of rows
+        """
+        self.matcher.write_output_data_to_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', self.TESTS_DATA_1)
+        rows = self.matcher.iter_input_data_from_xls(self.OUTPUT_BASE_FILE_PATH+'.xls')
+        self.assertEqual(self.TESTS_DATA_1[0], next(rows))
+        self.assertEqual(self.TESTS_DATA_1[1:], list(rows))
+        rows = self.matcher.iter_input_data_from_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', [3, 'Activated'])
+        self.assertEqual([('Name', 'Activated'), ('Marc ASSIN', 'Yes')], list(rows)[:2])
+        with open(self.OUTPUT_BASE_FILE_PATH+'.xls', 'rb') as xls_file:
+            file_contents = xls_file.read()
+        rows = self.matcher.iter_input_data_from_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', file_contents = file_contents)
+        self.assertEqual(self.TESTS_DATA_1, list(rows))
+
+    def test_iter_input_data_with_columns(self):
+        """Test read of some columns by number or by name
+        """
+        rows = list(self.matcher.iter_input_data(self.TEST_FILE_1_PATH, [3, 'Birthdate', 'Name', 1]))
+        self.assertEqual(('Name', 'Birthdate', 'Activated'), rows[0])
+        self.assertEqual(('Marc ASSIN', '02/10/1970', 'Yes'), rows[1])
+        self.assertEqual(len(self.TESTS_DATA_1), len(rows))
+        with self.assertRaises(Exception):
+            list(self.matcher.iter_input_data(self.TEST_FILE_1_PATH, [3, 'Unknown']))
+
+    def test_iter_input_data_from_sheets(self):
+        """Test read of several sheets as one table
+        """
+        header = self.TESTS_DATA_2[0]
+        other_sheets = [('Feb', [header] + self.TESTS_DATA_2[2:4]), ('Mar', [header, self.TESTS_DATA_2[4]])]
+        for extension in ['.xlsx', '.xls']:
+            filename = self.OUTPUT_BASE_FILE_PATH + extension
+            self.matcher.write_output_data(filename, [header, self.TESTS_DATA_2[1]], other_sheets)
+            self.assertEqual(self.TESTS_DATA_2, [list(row) for row in self.matcher.iter_input_data(filename, sheets = '*')])
+            rows = [list(row) for row in self.matcher.iter_input_data(filename, sheets = '3,F*')]
+            self.assertEqual([header, self.TESTS_DATA_2[4]] + self.TESTS_DATA_2[2:4], rows)
+            rows = list(self.matcher.iter_input_data(filename, ['Name'], sheets = 'match,Mar'))
+            self.assertEqual([('Name',), ('Jean-Luc PASDIDEE',), ('Karl DO',)], rows)
+            with self.assertRaises(Exception):
+                self.matcher.iter_input_data(filename, sheets = 'Apr')
+
+    def test_iter_input_data_from_glob(self):
+        """Test read of several files as one table
+        """
+        header = self.TESTS_DATA_2[0]
+        for day in range(1, 5):
+            self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH + '_' + str(day) + '.csv', [header, self.TESTS_DATA_2[day]])
+        rows = list(self.matcher.iter_input_data(self.OUTPUT_BASE_FILE_PATH + '_*.csv'))
+        self.assertEqual(self.TESTS_DATA_2, rows)
+        self.assertTrue(self.matcher.input_exists(self.OUTPUT_BASE_FILE_PATH + '_*.csv'))
+        self.assertFalse(self.matcher.input_exists(self.OUTPUT_BASE_FILE_PATH + '_*.xlsx'))
+        # Stop the read before the end of the files
+        self.matcher.READ_QUEUE_CHUNKS = 1
+        self.matcher.SPILL_CHUNK_SIZE = 1
+        parts = [(self.OUTPUT_BASE_FILE_PATH + '_' + str(day) + '.csv', 0) for day in range(1, 5)]
+        rows = self.matcher.iter_input_parts(parts)
+        self.assertEqual(header, next(rows))
+        rows.close()
+        with self.assertRaises(Exception):
+            self.matcher.iter_input_data(self.OUTPUT_BASE_FILE_PATH + '_*.xlsx')
+        # Parts with another header are refused, except without header
+        self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH + '_5.csv', [header[::-1], self.TESTS_DATA_2[1][::-1]])
+        with self.assertRaises(Exception):
+            list(self.matcher.iter_input_data(self.OUTPUT_BASE_FILE_PATH + '_*.csv'))
+        self.matcher.ignore_header = True
+        self.assertEqual(6, len(list(self.matcher.iter_input_data(self.OUTPUT_BASE_FILE_PATH + '_*.csv'))))
+
     def test_read_write_xls(self):
         """Test XLS methods
         """
@@ -153,6 +276,72 @@ class MatcherTest(unittest.TestCase):
         read_data = self.matcher.read_input_data_from_xls(self.OUTPUT_BASE_FILE_PATH+'.xls')
         self.assertEqual(self.TESTS_DATA_2[2][2], read_data[2][2])
 
+    def test_read_input_data_with_cache(self):
+        """Test read of input data through the cache
+        """
+        self.matcher.cache_dir = self.TEST_DIRECTORY
+        data = self.matcher.read_input_data_with_cache(self.TEST_FILE_1_PATH)
+        self.assertEqual(self.TESTS_DATA_1, data)
+        cache_filename = self.matcher.get_cache_filename(self.TEST_FILE_1_PATH)
+        self.assertTrue(os.path.exists(cache_filename))
+        # Second read comes from the cache
+        self.matcher.iter_input_data_from_file = None
+        self.assertEqual(self.TESTS_DATA_1, self.matcher.read_input_data_with_cache(self.TEST_FILE_1_PATH))
+        self.matcher.clear_cache()
+        self.assertFalse(os.path.exists(cache_filename))
+
+    def test_cache_with_csv_settings(self):
+        """Test that a CSV file is parsed again when its settings change
+        """
+        self.matcher.cache_dir = self.TEST_DIRECTORY
+        input_filename = self.OUTPUT_BASE_FILE_PATH+'_input.csv'
+        with open(input_filename, 'w') as input_file:
+            input_file.write('k;v\n1;x\n')
+        self.assertEqual([['k;v'], ['1;x']], self.matcher.read_input_data_with_cache(input_filename))
+        self.matcher.csv_delimiter = ';'
+        self.assertEqual([['k', 'v'], ['1', 'x']], self.matcher.read_input_data_with_cache(input_filename))
+        cache_filename = self.matcher.get_cache_filename(input_filename)
+        self.matcher.csv_quoting = 'all'
+        self.assertNotEqual(cache_filename, self.matcher.get_cache_filename(input_filename))
+        # Settings of CSV files don't change the cache of spreadsheets
+        cache_filename = self.matcher.get_cache_filename(self.TEST_FILE_1_PATH)
+        self.matcher.csv_delimiter = None
+        self.assertEqual(cache_filename, self.matcher.get_cache_filename(self.TEST_FILE_1_PATH))
+
+    def test_cache_eviction(self):
+        """Test removal of least recently used cache files
+        """
+        self.matcher.cache_dir = self.TEST_DIRECTORY
+        self.matcher.read_input_data_with_cache(self.TEST_FILE_1_PATH)
+        cache_filename_1 = self.matcher.get_cache_filename(self.TEST_FILE_1_PATH)
+        os.utime(cache_filename_1, (0, 0))
+        self.matcher.cache_size = os.path.getsize(cache_filename_1) / (1024 * 1024)
+        self.matcher.read_input_data_with_cache(self.TEST_FILE_2_PATH)
+        self.assertFalse(os.path.exists(cache_filename_1))
+        self.assertTrue(os.path.exists(self.matcher.get_cache_filename(self.TEST_FILE_2_PATH)))
+
+    def test_read_write_csv(self):
+        """Test CSV and TSV methods
+        """
+        self.matcher.write_output_data_to_csv(self.OUTPUT_BASE_FILE_PATH+'.csv', self.TESTS_DATA_1)
+        self.assertEqual(self.TESTS_DATA_1, list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv')))
+        self.matcher.write_output_data_to_csv(self.OUTPUT_BASE_FILE_PATH+'.tsv', self.TESTS_DATA_2, '\t')
+        self.assertEqual(self.TESTS_DATA_2, list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.tsv')))
+        self.matcher.csv_delimiter = ';'
+        self.matcher.write_output_data(self.OUTPUT_BASE_FILE_PATH+'.csv', self.TESTS_DATA_1)
+        self.assertEqual(self.TESTS_DATA_1, list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv')))
+
+    def test_detect_input_format(self):
+        """Test detection of the format from the content of the files
+        """
+        self.matcher.write_output_data_to_xls(self.OUTPUT_BASE_FILE_PATH+'.xlsx', self.TESTS_DATA_1)
+        self.assertEqual('xls', self.matcher.detect_input_format(self.OUTPUT_BASE_FILE_PATH+'.xlsx'))
+        self.matcher.write_output_data_to_xlsx(self.OUTPUT_BASE_FILE_PATH+'.csv', self.TESTS_DATA_1)
+        self.assertEqual('xlsx', self.matcher.detect_input_format(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.matcher.write_output_data_to_csv(self.OUTPUT_BASE_FILE_PATH+'.xls', self.TESTS_DATA_1)
+        self.assertEqual('csv', self.matcher.detect_input_format(self.OUTPUT_BASE_FILE_PATH+'.xls'))
+        self.assertEqual(self.TESTS_DATA_1, list(self.matcher.iter_input_data(self.OUTPUT_BASE_FILE_PATH+'.xls')))
+
 ################################################################################
 # Tests for args functions                                                     #
 ################################################################################
@@ -272,6 +461,489 @@ class MatcherTest(unittest.TestCase):
         self.assertEqual('Marc ASSIN', result[1][0])
         self.assertEqual('London', result[3][4])
 
+    def test_hash_and_nested_loop_engines(self):
+        """Test that hash and nested loop engines give the same result
+        """
+        input_data_1 = self.TESTS_DATA_1 + [['No', '12', 'Karl DO', '01/01/1990']]
+        input_data_2 = self.TESTS_DATA_2 + [['Lyon', 'Karl DO', 'Pink'], ['Nice', 'Nobody', 'White']]
+        for data_1, data_2 in [(input_data_1, input_data_2), (input_data_1, input_data_2[:3]), (input_data_1[:3], input_data_2)]:
+            self.matcher.match_column_1 = 3
+            self.matcher.match_column_2 = 2
+            self.matcher.input_data_1 = data_1
+            self.matcher.input_data_2 = data_2
+            self.matcher.match_engine = 'nested'
+            expected = self.matcher.match()
+            self.matcher.match_engine = 'hash'
+            self.assertEqual(expected, self.matcher.match())
+
+    def test_hash_engine_duplicated_keys_order(self):
+        """Test order of the rows with duplicated keys
+        """
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 1
+        self.matcher.input_data_1 = [['Key', 'A'], ['k1', 'a1'], ['k2', 'a2'], ['k1', 'a3']]
+        self.matcher.input_data_2 = [['Key', 'B'], ['k1', 'b1'], ['k1', 'b2']]
+        result = self.matcher.match()
+        self.assertEqual([['Key', 'A', 'B'], ['k1', 'a1', 'b1'], ['k1', 'a1', 'b2'], ['k1', 'a3', 'b1'], ['k1', 'a3', 'b2']], result)
+
+    def test_hash_engine_with_streamed_input(self):
+        """Test hash engine with an input read as a stream
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.input_data_1 = self.TESTS_DATA_1
+        self.matcher.input_data_2 = self.TESTS_DATA_2
+        expected = self.matcher.match()
+        self.matcher.input_data_1 = iter(self.TESTS_DATA_1)
+        self.assertEqual(expected, self.matcher.match())
+        self.matcher.input_data_1 = self.TESTS_DATA_1
+        self.matcher.input_data_2 = iter(self.TESTS_DATA_2)
+        self.assertEqual(expected, self.matcher.match())
+
+    def test_iter_match(self):
+        """Test generator form of the match
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.input_data_1 = self.TESTS_DATA_1
+        self.matcher.input_data_2 = self.TESTS_DATA_2
+        result = self.matcher.iter_match()
+        self.assertEqual(['Name', 'Activated', 'Money', 'Birthdate', 'City', 'Favorite color'], next(result))
+        self.assertEqual(self.matcher.match()[1:], list(result))
+
+    def test_sort_merge_engine(self):
+        """Test that sort-merge and hash engines give the same result
+        """
+        input_data_1 = [['Key', 'A']] + [[index % 7, 'a' + str(index)] for index in range(300)] + [['3', 'str'], [None, 'none'], [2.0, 'float']]
+        input_data_2 = [['Key', 'B']] + [[index % 11, 'b' + str(index)] for index in range(200)] + [['3', 'str'], [None, 'none']]
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 1
+        self.matcher.input_data_1 = input_data_1
+        self.matcher.input_data_2 = input_data_2
+        expected = self.matcher.match()
+        self.matcher.match_engine = 'sort-merge'
+        self.assertEqual(expected, self.matcher.match())
+        # Force the use of temporary files
+        self.matcher.memory_budget = 0.01
+        self.matcher.input_data_1 = iter(input_data_1)
+        self.matcher.input_data_2 = iter(input_data_2)
+        self.assertEqual(expected, self.matcher.match())
+
+    def test_read_sort_merge_argument(self):
+        """Test with sort-merge and memory-budget arguments
+        """
+        argv = ['exec', '--sort-merge', '--memory-budget=10', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('sort-merge', self.matcher.match_engine)
+        self.assertEqual(10, self.matcher.memory_budget)
+
+    def test_partitioned_hash_engine(self):
+        """Test that hash engine gives the same result with several workers
+        """
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 1
+        # Values with quotes and line breaks, in ranges of a few rows
+        self.matcher.RANGE_SIZE = 50
+        input1_filename = self.OUTPUT_BASE_FILE_PATH+'_input_1.csv'
+        input2_filename = self.OUTPUT_BASE_FILE_PATH+'_input_2.csv'
+        self.matcher.write_output_data_to_csv(input1_filename, [['Key', 'A']] + [[index % 7, 'a "' + str(index) + '"\nline'] for index in range(100)])
+        self.matcher.write_output_data_to_csv(input2_filename, [['Key', 'B']] + [[index % 11, 'b' + str(index)] for index in range(50)])
+        for columns_1, duplicates_2 in [(None, 'all'), (['A'], 'first'), (None, 'last')]:
+            self.matcher.columns_1 = columns_1
+            self.matcher.duplicates_2 = duplicates_2
+            self.matcher.workers = 1
+            self.matcher.start(input1_filename, input2_filename, self.OUTPUT_BASE_FILE_PATH+'.csv')
+            expected = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+            self.matcher.workers = 3
+            self.assertTrue(self.matcher.can_match_partitioned(input1_filename, input2_filename, self.OUTPUT_BASE_FILE_PATH+'.csv'))
+            self.matcher.add_listener(lambda event, data: None)
+            self.matcher.start(input1_filename, input2_filename, self.OUTPUT_BASE_FILE_PATH+'.csv')
+            self.assertEqual(expected, list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv')))
+            self.assertEqual(101, self.matcher.stats.counters['rows_read_1'])
+            self.assertEqual(51, self.matcher.stats.counters['rows_read_2'])
+            self.assertEqual(100, self.matcher.stats.counters['matched_rows'])
+            self.matcher.listeners = []
+        delimiter, header, ranges = self.matcher.split_csv_file(input1_filename, 3)
+        self.assertEqual(['Key', 'A'], header)
+        self.assertTrue(len(ranges) > 3)
+
+        # Several workers are refused when they would not be used
+        self.matcher.columns_1 = None
+        self.matcher.duplicates_2 = 'all'
+        for name, value in [('match_engine', 'sort-merge'), ('join_mode', 'left')]:
+            default = getattr(self.matcher, name)
+            setattr(self.matcher, name, value)
+            self.assertFalse(self.matcher.can_match_partitioned(input1_filename, input2_filename, self.OUTPUT_BASE_FILE_PATH+'.csv'))
+            with self.assertRaises(Exception):
+                self.matcher.start(input1_filename, input2_filename, self.OUTPUT_BASE_FILE_PATH+'.csv')
+            setattr(self.matcher, name, default)
+        with self.assertRaises(Exception):
+            self.matcher.start(input1_filename, input2_filename, self.OUTPUT_BASE_FILE_PATH+'.xlsx')
+
+    def test_read_workers_argument(self):
+        """Test with workers argument
+        """
+        argv = ['exec', '--workers=4', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual(4, self.matcher.workers)
+        argv = ['exec', '--workers=0', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_read_cache_arguments(self):
+        """Test with cache arguments
+        """
+        argv = ['exec', '--cache-dir=/tmp/cache', '--cache-size=10', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('/tmp/cache', self.matcher.cache_dir)
+        self.assertEqual(10, self.matcher.cache_size)
+        self.assertFalse(self.matcher.clear_cache_first)
+        test, err = self.matcher.read_argv(argv[:3] + ['--clear-cache'] + argv[3:])
+        self.assertEqual(True, test)
+        self.assertTrue(self.matcher.clear_cache_first)
+        # Clear the cache without match
+        test, err = self.matcher.read_clear_cache_argv(['exec', '--cache-dir=/tmp/cache', '--clear-cache'])
+        self.assertEqual(True, test)
+        test, err = self.matcher.read_clear_cache_argv(['exec', '--clear-cache'])
+        self.assertEqual(False, test)
+        test, err = self.matcher.read_clear_cache_argv(['exec', '--cache-dir=/tmp/cache', '--clear-cache', 'input1'])
+        self.assertEqual(False, test)
+
+    def test_read_columns_arguments(self):
+        """Test with columns arguments
+        """
+        argv = ['exec', '--columns-1=1,Name,4', '--columns-2=City', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual([1, 'Name', 4], self.matcher.columns_1)
+        self.assertEqual(['City'], self.matcher.columns_2)
+        argv = ['exec', '--columns-1=0', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_read_csv_arguments(self):
+        """Test with CSV arguments
+        """
+        argv = ['exec', '--delimiter=tab', '--encoding=latin-1', '--quoting=all', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('\t', self.matcher.csv_delimiter)
+        self.assertEqual('latin-1', self.matcher.csv_encoding)
+        self.assertEqual('all', self.matcher.csv_quoting)
+        argv = ['exec', '--quoting=foo', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_read_stats_arguments(self):
+        """Test with statistics arguments
+        """
+        argv = ['exec', '--stats', '--stats-file=stats.json', '--progress=2.5', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual(True, self.matcher.show_stats)
+        self.assertEqual('stats.json', self.matcher.stats_filename)
+        self.assertEqual(2.5, self.matcher.progress_interval)
+
+    def test_normalized_keys(self):
+        """Test match of keys with different case, spaces, accents and types
+        """
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 1
+        self.matcher.input_data_1 = [['Key', 'A'], ['Sacquet', 'a1'], [320988.0, 'a2'], ['Éowyn  Rohan', 'a3'], ['nan', 'a4']]
+        self.matcher.input_data_2 = [['Key', 'B'], [' SACQUET', 'b1'], ['320988', 'b2'], ['eowyn rohan', 'b3'], ['NaN', 'b4']]
+        self.assertEqual(1, len(self.matcher.match()))
+        self.matcher.normalizations = ['case', 'space', 'accents', 'numbers']
+        expected = [['Key', 'A', 'B'], ['Sacquet', 'a1', 'b1'], [320988.0, 'a2', 'b2'], ['Éowyn  Rohan', 'a3', 'b3'], ['nan', 'a4', 'b4']]
+        for engine in ['hash', 'nested', 'sort-merge']:
+            self.matcher.match_engine = engine
+            self.assertEqual(expected, self.matcher.match())
+        self.matcher.normalizations = ['numbers']
+        self.assertEqual([['Key', 'A', 'B'], [320988.0, 'a2', 'b2']], self.matcher.match())
+
+    def test_fuzzy_match(self):
+        """Test match of similar keys
+        """
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 1
+        self.matcher.input_data_1 = [['Key', 'A'], ['Jean-Luc PASDIDEE', 'a1'], ['Marc ASSIN', 'a2'], ['Karl DO', 'a3']]
+        self.matcher.input_data_2 = [['Key', 'B'], ['Jean Luc PASDIDE', 'b1'], ['Marc ASIN', 'b2'], ['Marc ASSIN', 'b3'], ['Paul DURAND', 'b4']]
+        self.matcher.fuzzy_threshold = 0.7
+        self.assertEqual([['Key', 'A', 'B'], ['Jean-Luc PASDIDEE', 'a1', 'b1'], ['Marc ASSIN', 'a2', 'b2'], ['Marc ASSIN', 'a2', 'b3']],
+                         self.matcher.match())
+        # Index of the first input
+        self.matcher.input_data_2 = self.matcher.input_data_2 + [['Other ' + str(index), 'b'] for index in range(10)]
+        self.assertEqual(['Marc ASSIN', 'a2', 'b2'], self.matcher.match()[2])
+        self.matcher.fuzzy_threshold = 1
+        self.assertEqual([['Key', 'A', 'B'], ['Marc ASSIN', 'a2', 'b3']], self.matcher.match())
+
+    def test_fuzzy_index_candidates(self):
+        """Test that only the keys which may be similar are compared
+        """
+        index = FuzzyIndex([['Key ' + str(index), index] for index in range(1000)], lambda row: row[0], 0.8)
+        grams = index.get_grams('Key 123')
+        # All the keys have the n-grams of 'Key '
+        self.assertEqual(1000, len(index.keys_by_gram['  K']))
+        self.assertTrue(len(index.get_candidates(grams)) <= 20)
+        self.assertEqual([['Key 12', 12], ['Key 123', 123]], index.get('Key 123'))
+        index.threshold = 0
+        self.assertEqual(1000, len(index.get_candidates(grams)))
+
+    def test_read_normalize_and_fuzzy_arguments(self):
+        """Test with normalize and fuzzy arguments
+        """
+        argv = ['exec', '--normalize', '--fuzzy=0.8', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual(['case', 'space', 'accents', 'numbers'], self.matcher.normalizations)
+        self.assertEqual(0.8, self.matcher.fuzzy_threshold)
+        argv = ['exec', '--normalize=case,numbers', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual(['case', 'numbers'], self.matcher.normalizations)
+        argv = ['exec', '--normalize=foo', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_composite_keys(self):
+        """Test match on several columns
+        """
+        self.matcher.match_column_1 = [3, 1]
+        self.matcher.match_column_2 = [2, 1]
+        self.matcher.input_data_1 = [['A', 'B', 'C'], ['x', 1, 'k1'], ['y', 2, 'k1'], ['x', 3, 'k2']]
+        self.matcher.input_data_2 = [['D', 'E'], ['x', 'k1'], ['x', 'k2'], ['y', 'k2'], ['x', 'k1']]
+        expected = [['C', 'A', 'B'], ['k1', 'x', 1], ['k1', 'x', 1], ['k2', 'x', 3]]
+        for engine in ['hash', 'nested', 'sort-merge']:
+            self.matcher.match_engine = engine
+            self.assertEqual(expected, self.matcher.match())
+
+    def test_start_with_composite_keys_and_columns(self):
+        """Test process on several columns with some columns of each input
+        """
+        self.matcher.match_column_1 = [3, 4]
+        self.matcher.match_column_2 = [2, 3]
+        self.create_test_file([['City', 'Name', 'Birthdate'], ['Troyes', 'John SMITH', '31/01/1988'], ['Paris', 'John SMITH', '01/01/1900']], self.TEST_FILE_2_PATH)
+        self.matcher.columns_1 = ['Money']
+        self.matcher.columns_2 = []
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual([['Name', 'Birthdate', 'Money'], ['John SMITH', '31/01/1988', '89']], result)
+
+    def test_read_composite_column_argument(self):
+        """Test with match columns argument
+        """
+        argv = ['exec', 'input1', '3,1,4', 'input2', '1,2,3', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual([3, 1, 4], self.matcher.match_column_1)
+        self.assertEqual([1, 2, 3], self.matcher.match_column_2)
+        argv = ['exec', 'input1', '3,1', 'input2', '1', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+        argv = ['exec', 'input1', '3,3', 'input2', '1,2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_match_multi(self):
+        """Test match of 3 inputs
+        """
+        input_1 = [['Key', 'A'], ['k1', 'a1'], ['k2', 'a2'], ['k3', 'a3']]
+        input_2 = [['B', 'Key'], ['b1', 'k1'], ['b3', 'k3'], ['b1bis', 'k1']]
+        input_3 = [['Key', 'C'], ['k3', 'c3'], ['k1', 'c1']]
+        result = list(self.matcher.iter_match_multi([(input_1, 0), (input_2, 1), (input_3, 0)]))
+        expected = [['Key', 'A', 'B', 'C'], ['k1', 'a1', 'b1', 'c1'], ['k1', 'a1', 'b1bis', 'c1'], ['k3', 'a3', 'b3', 'c3']]
+        self.assertEqual(expected, result)
+        # The first input is read as a stream
+        result = list(self.matcher.iter_match_multi([(iter(input_1), 0), (input_2, 1), (input_3, 0)]))
+        self.assertEqual(expected, result)
+
+    def test_read_multi_arguments(self):
+        """Test with more than 2 input files
+        """
+        argv = ['exec', 'input1', '1', 'input2', '2', 'input3', '3', 'input4', '1', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual([('input3', 3), ('input4', 1)], self.matcher.extra_inputs)
+        argv = ['exec', 'input1', '1', 'input2', '2', 'input3', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+        argv = ['exec', 'input1', '1', 'input2', '2', 'input3', '1,2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_bloom_filter(self):
+        """Test keys of a bloom filter
+        """
+        keys = BloomFilter(1000, 0.01)
+        for key_index in range(1000):
+            keys.add('K' + str(key_index))
+        keys.add(12)
+        keys.add(('A', 3.0))
+        self.assertTrue(all('K' + str(key_index) in keys for key_index in range(1000)))
+        self.assertTrue(12.0 in keys)
+        self.assertTrue(('A', 3) in keys)
+        false_positives = len([key_index for key_index in range(1000, 11000) if 'K' + str(key_index) in keys])
+        self.assertTrue(false_positives < 300)
+
+    def test_filter_rows(self):
+        """Test pre-filter of the rows of an input
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        for prefilter in self.matcher.PREFILTERS:
+            self.matcher.prefilter = prefilter
+            keys = self.matcher.build_prefilter(self.TESTS_DATA_2[:3], 2)
+            rows = list(self.matcher.filter_rows(iter(self.TESTS_DATA_1), keys, 1))
+            self.assertEqual([self.TESTS_DATA_1[0], self.TESTS_DATA_1[2], self.TESTS_DATA_1[4]], rows)
+
+    def test_read_shard_arguments(self):
+        """Test with shard arguments
+        """
+        argv = ['exec', '--rows-per-shard=1000', '--shard-mode=files', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual(1000, self.matcher.rows_per_shard)
+        self.assertEqual('files', self.matcher.shard_mode)
+        argv = ['exec', '--shard-mode=foo', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
+    def test_duplicates_policies(self):
+        """Test policies for the rows with the same key
+        """
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 1
+        input_data_1 = [['Key', 'A'], ['k1', 'a1'], ['k2', 'a2']]
+        input_data_2 = [['Key', 'B', 'C'], ['k1', 'b1', 1], ['k1', 'b2', 2], ['k2', 'b3', 3], ['k1', 'b1', '4']]
+        expected = {
+            'all': [['k1', 'a1', 'b1', 1], ['k1', 'a1', 'b2', 2], ['k1', 'a1', 'b1', '4'], ['k2', 'a2', 'b3', 3]],
+            'first': [['k1', 'a1', 'b1', 1], ['k2', 'a2', 'b3', 3]],
+            'last': [['k1', 'a1', 'b1', '4'], ['k2', 'a2', 'b3', 3]],
+            'cap:2': [['k1', 'a1', 'b1', 1], ['k1', 'a1', 'b2', 2], ['k2', 'a2', 'b3', 3]],
+            'concat': [['k1', 'a1', 'b1, b2', '1, 2, 4'], ['k2', 'a2', 'b3', 3]],
+            'aggregate': [['k1', 'a1', 'b1, b2', 7], ['k2', 'a2', 'b3', 3]]
+        }
+        self.matcher.add_listener(lambda event, data: None)
+        for policy, rows in expected.items():
+            for engine in ['hash', 'sort-merge']:
+                self.matcher.stats = MatchStats()
+                self.matcher.match_engine = engine
+                self.matcher.duplicates_2 = policy
+                self.matcher.input_data_1 = input_data_1
+                self.matcher.input_data_2 = iter(input_data_2)
+                if self.matcher.groups_duplicates(2):
+                    # Rows grouped by key are refused on an input read as a stream
+                    with self.assertRaises(Exception):
+                        self.matcher.match()
+                    if 'sort-merge' == engine:
+                        continue
+                    self.matcher.input_data_2 = input_data_2
+                self.assertEqual([['Key', 'A', 'B', 'C']] + rows, self.matcher.match())
+                self.assertEqual(0 if 'all' == policy else 1, self.matcher.stats.counters.get('duplicate_keys_resolved_2', 0))
+        self.matcher.duplicates_2 = 'error'
+        self.matcher.input_data_2 = input_data_2
+        with self.assertRaises(Exception):
+            self.matcher.match()
+
+    def test_join_modes(self):
+        """Test rows without match of each join mode
+        """
+        self.matcher.match_column_1 = 1
+        self.matcher.match_column_2 = 2
+        input_data_1 = [['Key', 'A'], ['k1', 'a1'], ['k2', 'a2'], ['k3', 'a3']]
+        input_data_2 = [['B', 'Key'], ['b4', 'k4'], ['b1', 'k1'], ['b5', 'k5'], ['b3', 'k3']]
+        matched = [['Key', 'A', 'B'], ['k1', 'a1', 'b1'], ['k3', 'a3', 'b3']]
+        unmatched_1 = [['Key', 'A'], ['k2', 'a2']]
+        unmatched_2 = [['B', 'Key'], ['b4', 'k4'], ['b5', 'k5']]
+        expected = {
+            'left': (matched, [('unmatched_1', unmatched_1)]),
+            'right': (matched, [('unmatched_2', unmatched_2)]),
+            'full': (matched, [('unmatched_1', unmatched_1), ('unmatched_2', unmatched_2)]),
+            'anti': (unmatched_1, [])
+        }
+        for join_mode, (rows, other_sheets) in expected.items():
+            self.matcher.join_mode = join_mode
+            # Index of the second input, then index of the first input
+            for data_1, data_2 in [(iter(input_data_1), input_data_2), (input_data_1, iter(input_data_2))]:
+                self.matcher.input_data_1 = data_1
+                self.matcher.input_data_2 = data_2
+                output_data, result_sheets = self.matcher.iter_match_join()
+                self.assertEqual(rows, list(output_data))
+                self.assertEqual(other_sheets, [(name, list(sheet_data)) for name, sheet_data in result_sheets])
+        self.matcher.match_engine = 'nested'
+        with self.assertRaises(Exception):
+            self.matcher.iter_match_join()
+
+    def test_spill_buffer(self):
+        """Test rows of a buffer written in a temporary file
+        """
+        buffer = SpillBuffer(200)
+        for index in range(100):
+            buffer.append(['Row', index])
+        self.assertTrue(buffer.spill_file is not None)
+        self.assertEqual([['Row', index] for index in range(100)], list(buffer))
+
+    def test_read_duplicates_arguments(self):
+        """Test with duplicates arguments
+        """
+        argv = ['exec', '--duplicates-1=cap:10', '--duplicates-2=first', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('cap:10', self.matcher.duplicates_1)
+        self.assertEqual('first', self.matcher.duplicates_2)
+        for policy in ['cap:0', 'cap:A', 'foo']:
+            argv = ['exec', '--duplicates-1=' + policy, 'input1', '1', 'input2', '2', 'output']
+            test, err = self.matcher.read_argv(argv)
+            self.assertEqual(False, test)
+
+    def test_match_rows(self):
+        """Test match of Python iterables
+        """
+        read_rows = []
+
+        def iter_rows():
+            for row in self.TESTS_DATA_1:
+                read_rows.append(row)
+                yield row
+
+        merged_rows = match_rows(iter_rows(), self.TESTS_DATA_2, 3, 2)
+        self.assertEqual([], read_rows)
+        self.assertEqual(['Name', 'Activated', 'Money', 'Birthdate', 'City', 'Favorite color'], next(merged_rows))
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Paris', 'Purple'], next(merged_rows))
+        self.assertEqual(2, len(read_rows))
+        self.assertEqual(3, len(list(merged_rows)))
+        # Key functions and options
+        merged_rows = list(match_rows(self.TESTS_DATA_1, self.TESTS_DATA_2, lambda row: row[2].lower(),
+                                      lambda row: row[1].upper(), ignore_header = True, normalizations = ['case'],
+                                      match_engine = 'sort-merge'))
+        self.assertEqual(4, len(merged_rows))
+        self.assertEqual(['jean-luc pasdidee', 'Yes', '69', 'Jean-Luc PASDIDEE', '06/07/1977', 'New-York', 'Jean-Luc PASDIDEE', 'Green'],
+                         sorted(merged_rows)[0])
+        merged_rows = list(match_rows(self.TESTS_DATA_1, self.TESTS_DATA_2, lambda row: row[2], 2))
+        self.assertEqual(['key', 'Activated', 'Money', 'Name', 'Birthdate', 'City', 'Favorite color'], merged_rows[0])
+        with self.assertRaises(TypeError):
+            match_rows(self.TESTS_DATA_1, self.TESTS_DATA_2, 3, 2, foo = 1)
+        # Join modes and options which need files
+        merged_rows = list(match_rows(self.TESTS_DATA_1, self.TESTS_DATA_2[:3], 3, 2, join_mode = 'anti'))
+        self.assertEqual([self.TESTS_DATA_1[0], self.TESTS_DATA_1[1], self.TESTS_DATA_1[3]], merged_rows)
+        for options in [{'join_mode': 'left'}, {'prefilter': 'set'}, {'workers': 2}, {'rows_per_shard': 10}, {'extra_inputs': []}]:
+            with self.assertRaises(TypeError):
+                match_rows(self.TESTS_DATA_1, self.TESTS_DATA_2, 3, 2, **options)
+
+    def test_read_engine_argument(self):
+        """Test with engine argument
+        """
+        self.assertEqual('hash', self.matcher.match_engine)
+        argv = ['exec', '--engine=nested', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('nested', self.matcher.match_engine)
+        argv = ['exec', '--engine=foo', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(False, test)
+
 ################################################################################
 # Tests for start function                                                     #
 ################################################################################
@@ -314,16 +986,393 @@ class MatcherTest(unittest.TestCase):
         TEST_FILE_2_PATH = self.TEST_DIRECTORY+os.path.sep+self.TEST_FILENAME+'2.xls'
         self.create_test_file(self.TESTS_DATA_1, TEST_FILE_1_PATH)
         self.create_test_file(self.TESTS_DATA_2, TEST_FILE_2_PATH)
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
         self.matcher.start(TEST_FILE_1_PATH, TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.xls')
-        self.assertEqual(self.TESTS_DATA_1, self.matcher.input_data_1)
-        self.assertEqual(self.TESTS_DATA_2, self.matcher.input_data_2)
+        self.assertEqual('Marc ASSIN', self.get_cell_in_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', 2, 1))
+        self.assertEqual('London', self.get_cell_in_xls(self.OUTPUT_BASE_FILE_PATH+'.xls', 4, 5))
 
     def test_two_xlsx_input_files(self):
         """Test readed data from two Excel files
         """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
         self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.xlsx')
-        self.assertEqual(self.TESTS_DATA_1, self.matcher.input_data_1)
-        self.assertEqual(self.TESTS_DATA_2, self.matcher.input_data_2)
+        self.assertEqual('Marc ASSIN', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 2, 1))
+        self.assertEqual('London', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 4, 5))
+
+    def test_write_index(self):
+        """Test index file of an input file
+        """
+        self.matcher.match_column_2 = 2
+        self.matcher.write_index(self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.idx')
+        index = MatchIndex(self.OUTPUT_BASE_FILE_PATH+'.idx')
+        self.assertEqual(self.TESTS_DATA_2[0], index.header)
+        self.assertEqual(2, index.match_column)
+        self.assertEqual(4, len(index))
+        self.assertEqual([self.TESTS_DATA_2[2]], index.get('John SMITH'))
+        self.assertEqual(None, index.get('Nobody'))
+        index.close()
+        # Policy for duplicated keys of the second input
+        self.matcher.match_column_2 = 1
+        self.matcher.duplicates_2 = 'last'
+        self.matcher.write_output_data_to_csv(self.OUTPUT_BASE_FILE_PATH+'_input_2.csv', [['Key', 'B'], ['k1', 'b1'], ['k1', 'b2']])
+        self.matcher.write_index(self.OUTPUT_BASE_FILE_PATH+'_input_2.csv', self.OUTPUT_BASE_FILE_PATH+'.idx')
+        index = MatchIndex(self.OUTPUT_BASE_FILE_PATH+'.idx')
+        self.assertEqual([['k1', 'b2']], index.get('k1'))
+        index.close()
+
+    def test_batch_with_index(self):
+        """Test match of input files with an index file
+        """
+        self.matcher.match_column_2 = 2
+        self.matcher.write_index(self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.idx')
+        self.matcher.match_column_1 = 3
+        self.matcher.out_dir = self.TEST_DIRECTORY+os.path.sep+'out'
+        try:
+            self.matcher.start_batch(self.OUTPUT_BASE_FILE_PATH+'.idx', [self.TEST_DIRECTORY+os.path.sep+'input1.xls*'])
+            output_filename = self.matcher.out_dir+os.path.sep+'input1.xlsx'
+            self.assertEqual('Favorite color', self.get_cell_in_xlsx(output_filename, 1, 6))
+            self.assertEqual('Marc ASSIN', self.get_cell_in_xlsx(output_filename, 2, 1))
+            self.assertEqual('London', self.get_cell_in_xlsx(output_filename, 4, 5))
+        finally:
+            for file in os.listdir(self.matcher.out_dir):
+                os.remove(self.matcher.out_dir+os.path.sep+file)
+            os.rmdir(self.matcher.out_dir)
+
+    def test_read_index_and_batch_arguments(self):
+        """Test arguments of index and batch commands
+        """
+        test, err = self.matcher.read_index_argv(['exec', 'index', 'ref.xlsx', '3', 'ref.idx'])
+        self.assertEqual(True, test)
+        self.assertEqual(3, self.matcher.match_column_2)
+        test, err = self.matcher.read_index_argv(['exec', 'index', 'ref.xlsx', 'A', 'ref.idx'])
+        self.assertEqual(False, test)
+        test, err = self.matcher.read_batch_argv(['exec', 'batch', 'ref.idx', '1', 'in_1.xlsx', 'in_2.xlsx', '--out-dir=out'])
+        self.assertEqual(True, test)
+        self.assertEqual(1, self.matcher.match_column_1)
+        self.assertEqual('out', self.matcher.out_dir)
+        test, err = self.matcher.read_batch_argv(['exec', 'batch', 'ref.idx', '1', 'in_1.xlsx'])
+        self.assertEqual(False, test)
+
+    def test_start_with_columns(self):
+        """Test process with some columns of each input
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.columns_1 = ['Money']
+        self.matcher.columns_2 = [3]
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.xlsx')
+        self.assertEqual('Name', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 1, 1))
+        self.assertEqual('Money', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 1, 2))
+        self.assertEqual('Favorite color', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 1, 3))
+        self.assertEqual(None, self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 1, 4))
+        self.assertEqual('Marc ASSIN', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 2, 1))
+        self.assertEqual('Purple', self.get_cell_in_xlsx(self.OUTPUT_BASE_FILE_PATH+'.xlsx', 2, 3))
+
+    def test_csv_input_files_without_spreadsheet_libraries(self):
+        """Test match of CSV files, spreadsheet libraries must not be imported
+        """
+        input1_filename = self.TEST_DIRECTORY+os.path.sep+self.TEST_FILENAME+'1.csv'
+        input2_filename = self.TEST_DIRECTORY+os.path.sep+self.TEST_FILENAME+'2.csv'
+        self.matcher.write_output_data_to_csv(input1_filename, self.TESTS_DATA_1)
+        self.matcher.write_output_data_to_csv(input2_filename, self.TESTS_DATA_2)
+        script = 'import sys, pymatcher; ' + \
+                 'matcher = pymatcher.Matcher(); matcher.read_argv(sys.argv); matcher.start(*sys.argv[1::2]); ' + \
+                 'print(sorted(set(sys.modules) & {"openpyxl", "xlrd", "xlwt"}))'
+        output = subprocess.check_output([sys.executable, '-c', script, input1_filename, '3', input2_filename, '2', self.OUTPUT_BASE_FILE_PATH+'.csv'])
+        self.assertEqual('[]', output.decode().strip())
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Paris', 'Purple'], result[1])
+
+    def test_start_with_stats(self):
+        """Test statistics sent to listeners and written in a file
+        """
+        events = []
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.input_data_2 = []
+        self.matcher.add_listener(lambda event, data: events.append((event, data)))
+        self.matcher.stats_filename = self.OUTPUT_BASE_FILE_PATH+'.json'
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.xlsx')
+        self.assertEqual(['phase', 'stats'], sorted(set(event for event, data in events)))
+        self.assertTrue(('phase', 'write') in events)
+        stats = events[-1][1]
+        self.assertEqual(5, stats['counters']['rows_read_1'])
+        self.assertEqual(5, stats['counters']['rows_read_2'])
+        self.assertEqual(4, stats['counters']['index_keys'])
+        self.assertEqual(4, stats['counters']['matched_rows'])
+        self.assertEqual(0, stats['counters']['unmatched_rows'])
+        self.assertEqual(5, stats['counters']['output_rows'])
+        self.assertEqual(['match', 'read_1', 'read_2', 'write'], sorted(stats['phases']))
+        with open(self.OUTPUT_BASE_FILE_PATH+'.json') as stats_file:
+            self.assertEqual(stats['counters'], json.load(stats_file)['counters'])
+
+    def test_start_with_3_inputs(self):
+        """Test process of 3 input files
+        """
+        input3_filename = self.TEST_DIRECTORY+os.path.sep+self.TEST_FILENAME+'3.xlsx'
+        self.create_test_file([['Name', 'Pet'], ['Marc ASSIN', 'Cat'], ['Karl DO', 'Dog'], ['Jean PEUPLU', 'Fish']], input3_filename)
+        argv = ['exec', self.TEST_FILE_1_PATH, '3', self.TEST_FILE_2_PATH, '2', input3_filename, '1', self.OUTPUT_BASE_FILE_PATH+'.csv']
+        result_argv, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, result_argv)
+        self.matcher.add_listener(lambda event, data: None)
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual(['Name', 'Activated', 'Money', 'Birthdate', 'City', 'Favorite color', 'Pet'], result[0])
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Paris', 'Purple', 'Cat'], result[1])
+        self.assertEqual(3, len(result))
+        self.assertEqual(4, self.matcher.stats.counters['rows_read_3'])
+        # Policies for duplicated keys of the 2 first inputs
+        self.create_test_file(self.TESTS_DATA_2 + [['Nantes', 'Marc ASSIN', 'Black']], self.TEST_FILE_2_PATH)
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        self.assertEqual(4, len(list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))))
+        self.matcher.duplicates_2 = 'last'
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Nantes', 'Black', 'Cat'], result[1])
+        self.assertEqual(3, len(result))
+
+    def test_start_delta(self):
+        """Test process which update the output of the previous run
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.state_filename = self.OUTPUT_BASE_FILE_PATH+'.state'
+        input1_filename = self.TEST_DIRECTORY+os.path.sep+self.TEST_FILENAME+'1.csv'
+        input2_filename = self.TEST_DIRECTORY+os.path.sep+self.TEST_FILENAME+'2.csv'
+        output_filename = self.OUTPUT_BASE_FILE_PATH+'.csv'
+        self.matcher.write_output_data_to_csv(input1_filename, self.TESTS_DATA_1)
+        self.matcher.write_output_data_to_csv(input2_filename, self.TESTS_DATA_2)
+        changes = self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(4, changes['inserted_rows_1'])
+        self.assertEqual(4, changes['inserted_rows_2'])
+        first_result = list(self.matcher.iter_input_data_from_csv(output_filename))
+        self.assertEqual(5, len(first_result))
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Paris', 'Purple'], first_result[1])
+        # Nothing changed
+        changes = self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(0, sum(changes.values()))
+        # A row changed and a row inserted in the second input, only the row with the changed key is matched again
+        data_2 = [list(row) for row in self.TESTS_DATA_2] + [['Lyon', 'Nobody', 'White']]
+        data_2[3][0] = 'Lyon, "France"\nEurope'
+        self.matcher.write_output_data_to_csv(input2_filename, data_2)
+        self.matcher.add_listener(lambda event, data: None)
+        changes = self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual({'inserted_rows_1': 0, 'changed_rows_1': 0, 'deleted_rows_1': 0,
+                          'inserted_rows_2': 1, 'changed_rows_2': 1, 'deleted_rows_2': 0}, changes)
+        self.assertEqual(1, self.matcher.stats.counters['rematched_rows'])
+        self.assertEqual(3, self.matcher.stats.counters['copied_rows'])
+        result = list(self.matcher.iter_input_data_from_csv(output_filename))
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Lyon, "France"\nEurope', 'Purple'], result[1])
+        self.assertEqual(first_result[2:], result[2:])
+        # Rows deleted and a row inserted in the first input
+        data_1 = self.TESTS_DATA_1[:2] + [['No', '1', 'Nobody', '01/01/2000']] + self.TESTS_DATA_1[3:-1]
+        self.matcher.write_output_data_to_csv(input1_filename, data_1)
+        changes = self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(2, changes['deleted_rows_1'])
+        self.assertEqual(1, changes['inserted_rows_1'])
+        self.assertEqual(1, self.matcher.stats.counters['rematched_rows'])
+        result = list(self.matcher.iter_input_data_from_csv(output_filename))
+        self.assertEqual(['Marc ASSIN', 'Nobody', 'Karl DO'], [row[0] for row in result[1:]])
+        self.assertEqual(['Nobody', 'No', '1', '01/01/2000', 'Lyon', 'White'], result[2])
+        # Policy for duplicated keys of the second input
+        self.matcher.write_output_data_to_csv(input2_filename, data_2 + [['Nantes', 'Marc ASSIN', 'Black']])
+        self.matcher.duplicates_2 = 'first'
+        changes = self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(1, changes['inserted_rows_2'])
+        result = list(self.matcher.iter_input_data_from_csv(output_filename))
+        self.assertEqual(['Purple', 'White', 'Blue'], [row[5] for row in result[1:]])
+        self.matcher.duplicates_2 = 'last'
+        self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(['Black', 'White', 'Blue'], [row[5] for row in list(self.matcher.iter_input_data_from_csv(output_filename))[1:]])
+        # Rows of a duplicated key in another order
+        self.matcher.duplicates_2 = 'all'
+        self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(3, self.matcher.stats.counters['rematched_rows'])
+        self.matcher.write_output_data_to_csv(input2_filename, data_2[:1] + [['Nantes', 'Marc ASSIN', 'Black']] + data_2[1:])
+        changes = self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(0, sum(changes.values()))
+        self.assertEqual(1, self.matcher.stats.counters['rematched_rows'])
+        self.assertEqual(2, self.matcher.stats.counters['copied_rows'])
+        self.assertEqual(['Black', 'Purple', 'White', 'Blue'], [row[5] for row in list(self.matcher.iter_input_data_from_csv(output_filename))[1:]])
+        # The output is rewritten if it is modified
+        self.matcher.write_output_data_to_csv(output_filename, [['modified']])
+        self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.assertEqual(5, len(list(self.matcher.iter_input_data_from_csv(output_filename))))
+        # Unsupported options
+        self.matcher.join_mode = 'anti'
+        with self.assertRaises(Exception):
+            self.matcher.start(input1_filename, input2_filename, output_filename)
+        self.matcher.join_mode = 'inner'
+        with self.assertRaises(Exception):
+            self.matcher.start(self.TEST_FILE_1_PATH, input2_filename, output_filename)
+
+    def test_start_with_prefilter(self):
+        """Test process with a pre-filter of the biggest input before the sort-merge
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.match_engine = 'sort-merge'
+        self.matcher.prefilter = 'bloom'
+        self.create_test_file(self.TESTS_DATA_2[:2], self.TEST_FILE_2_PATH)
+        self.matcher.add_listener(lambda event, data: None)
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual([['Name', 'Activated', 'Money', 'Birthdate', 'City', 'Favorite color'],
+                          ['Jean-Luc PASDIDEE', 'Yes', '69', '06/07/1977', 'New-York', 'Green']], result)
+        self.assertTrue(self.matcher.stats.counters['prefiltered_rows'] >= 2)
+        argv = ['exec', '--prefilter=set', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('set', self.matcher.prefilter)
+
+    def test_start_with_full_join(self):
+        """Test process which write the rows without match in other sheets or files
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.join_mode = 'full'
+        self.create_test_file(self.TESTS_DATA_2[:3], self.TEST_FILE_2_PATH)
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.xlsx')
+        workbook = openpyxl.load_workbook(self.OUTPUT_BASE_FILE_PATH+'.xlsx')
+        self.assertEqual(['match', 'unmatched_1', 'unmatched_2'], workbook.sheetnames)
+        self.assertEqual(3, workbook['match'].max_row)
+        self.assertEqual([self.TESTS_DATA_1[0], self.TESTS_DATA_1[1], self.TESTS_DATA_1[3]], [list(row) for row in workbook['unmatched_1'].values])
+        self.assertEqual([self.TESTS_DATA_2[0]], [list(row) for row in workbook['unmatched_2'].values])
+        self.matcher.join_mode = 'left'
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        self.assertEqual(3, len(list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))))
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'_unmatched_1.csv'))
+        self.assertEqual(['Karl DO', 'Marc ASSIN'], sorted(row[2] for row in result[1:]))
+        # The rows without match are kept by the prefilter
+        self.matcher.prefilter = 'set'
+        self.matcher.join_mode = 'anti'
+        self.matcher.start(self.TEST_FILE_1_PATH, self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual(['Karl DO', 'Marc ASSIN'], sorted(row[2] for row in result[1:]))
+        self.matcher.join_mode = 'right'
+        self.matcher.match_column_1 = 2
+        self.matcher.match_column_2 = 3
+        self.matcher.start(self.TEST_FILE_2_PATH, self.TEST_FILE_1_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'_unmatched_2.csv'))
+        self.assertEqual(['Karl DO', 'Marc ASSIN'], sorted(row[2] for row in result[1:]))
+        self.matcher.prefilter = None
+        argv = ['exec', '--join=anti', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('anti', self.matcher.join_mode)
+
+    def test_start_with_glob_and_sheets(self):
+        """Test process of a glob of files and of several sheets
+        """
+        self.matcher.match_column_1 = 3
+        self.matcher.match_column_2 = 2
+        self.matcher.sheets_2 = '*'
+        for part in range(2):
+            self.create_test_file(self.TESTS_DATA_1[:1] + self.TESTS_DATA_1[1 + part * 2:3 + part * 2],
+                                  self.TEST_DIRECTORY+os.path.sep+'part'+str(part)+'.xlsx')
+        self.matcher.write_output_data(self.TEST_FILE_2_PATH, self.TESTS_DATA_2[:3], [('Other', self.TESTS_DATA_2[:1] + self.TESTS_DATA_2[3:])])
+        self.matcher.start(self.TEST_DIRECTORY+os.path.sep+'part*.xlsx', self.TEST_FILE_2_PATH, self.OUTPUT_BASE_FILE_PATH+'.csv')
+        result = list(self.matcher.iter_input_data_from_csv(self.OUTPUT_BASE_FILE_PATH+'.csv'))
+        self.assertEqual(5, len(result))
+        self.assertEqual(['Marc ASSIN', 'Yes', '24', '02/10/1970', 'Paris', 'Purple'], result[1])
+        argv = ['exec', '--sheets-1=1,Feb*', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('1,Feb*', self.matcher.sheets_1)
+
+    def test_read_state_argument(self):
+        """Test with state argument
+        """
+        argv = ['exec', '--state=run.state', 'input1', '1', 'input2', '2', 'output']
+        test, err = self.matcher.read_argv(argv)
+        self.assertEqual(True, test)
+        self.assertEqual('run.state', self.matcher.state_filename)
+
+    def test_server_requests(self):
+        """Test lookups of the server, and reload of modified files
+        """
+        server = MatchServer(self.matcher, [(self.TEST_FILE_2_PATH, 2)])
+        self.assertEqual({'rows': [['Marc ASSIN', 'Paris', 'Purple']]}, server.handle_request({'key': 'Marc ASSIN'}))
+        self.assertEqual({'results': [[['Karl DO', 'London', 'Blue']], []]}, server.handle_request({'keys': ['Karl DO', 'Nobody']}))
+        self.assertEqual({'header': ['Name', 'City', 'Favorite color']}, server.handle_request({'header': True}))
+        self.assertTrue('error' in server.handle_request({'table': 'foo', 'key': 'Karl DO'}))
+        self.assertTrue('error' in server.handle_request({}))
+        data_2 = [list(row) for row in self.TESTS_DATA_2]
+        data_2[4][0] = 'Dublin'
+        self.create_test_file(data_2, self.TEST_FILE_2_PATH)
+        table = server.tables['input2']
+        table['mtime'] -= 1
+        self.assertEqual({'rows': [['Karl DO', 'Dublin', 'Blue']]}, server.handle_request({'table': 'input2', 'key': 'Karl DO'}))
+
+    def test_server_composite_keys(self):
+        """Test lookups of the server on several columns with normalization
+        """
+        self.matcher.normalizations = ['case']
+        server = MatchServer(self.matcher, [(self.TEST_FILE_2_PATH, [2, 1])])
+        self.assertEqual({'rows': [['John SMITH', 'Troyes', 'Red']]}, server.handle_request({'key': ['john smith', 'TROYES']}))
+        self.assertTrue('error' in server.handle_request({'key': 'john smith'}))
+
+    def test_server_connection(self):
+        """Test requests sent on the Unix socket of the server
+        """
+        socket_path = self.TEST_DIRECTORY+os.path.sep+'server.sock'
+        server = MatchServer(self.matcher, [(self.TEST_FILE_2_PATH, 2)])
+
+        async def send_requests():
+            task = asyncio.ensure_future(server.serve(socket_path))
+            while not os.path.exists(socket_path):
+                await asyncio.sleep(0.01)
+            reader, writer = await asyncio.open_unix_connection(socket_path)
+            writer.write(b'{"key": "John SMITH"}\nfoo\n')
+            responses = [json.loads(await reader.readline()), json.loads(await reader.readline())]
+            writer.close()
+            task.cancel()
+            return responses
+
+        responses = asyncio.run(send_requests())
+        self.assertEqual({'rows': [['John SMITH', 'Troyes', 'Red']]}, responses[0])
+        self.assertTrue('error' in responses[1])
+
+    def test_server_long_requests(self):
+        """Test requests longer than the default limit of asyncio streams, and above the limit of the server
+        """
+        socket_path = self.TEST_DIRECTORY+os.path.sep+'server.sock'
+        server = MatchServer(self.matcher, [(self.TEST_FILE_2_PATH, 2)])
+        keys = ['John SMITH'] + ['Nobody %d' % key_index for key_index in range(10000)]
+
+        async def send_request(request):
+            task = asyncio.ensure_future(server.serve(socket_path))
+            while not os.path.exists(socket_path):
+                await asyncio.sleep(0.01)
+            reader, writer = await asyncio.open_unix_connection(socket_path, limit=server.MAX_REQUEST_SIZE)
+            writer.write(request + b'\n')
+            response = json.loads(await reader.readline())
+            writer.close()
+            task.cancel()
+            os.remove(socket_path)
+            return response
+
+        request = json.dumps({'keys': keys}).encode('utf-8')
+        self.assertTrue(len(request) > 64 * 1024)
+        response = asyncio.run(send_request(request))
+        self.assertEqual(len(keys), len(response['results']))
+        self.assertEqual([['John SMITH', 'Troyes', 'Red']], response['results'][0])
+        server.MAX_REQUEST_SIZE = 1024
+        self.assertTrue('error' in asyncio.run(send_request(request)))
+
+    def test_read_serve_arguments(self):
+        """Test arguments of the serve command
+        """
+        test, err, tables = self.matcher.read_serve_argv(['exec', 'serve', 'ref1', '2', 'ref2', '1,3', '--port=8000'])
+        self.assertEqual(True, test)
+        self.assertEqual([('ref1', 2), ('ref2', [1, 3])], tables)
+        self.assertEqual(8000, self.matcher.server_port)
+        test, err, tables = self.matcher.read_serve_argv(['exec', 'serve', 'ref1', '2'])
+        self.assertEqual(False, test)
+        test, err, tables = self.matcher.read_serve_argv(['exec', 'serve', 'ref1', '--socket=server.sock'])
+        self.assertEqual(False, test)
 
 ################################################################################
 # Tests for full process                                                       #